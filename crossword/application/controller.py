@@ -1,7 +1,10 @@
 import tkinter as tk
 import tkinter.messagebox as mb
+import os
+import time
 import string
 import queue
+import collections
 from crossword.application import view as _view
 from crossword.application import model as _model
 from crossword.network import custom
@@ -9,6 +12,180 @@ from crossword.settings import settings
 from crossword.constants import *
 
 
+class Wakeup:
+    """Wakes the Tk loop from other threads when events are queued.
+
+    A self-pipe registered as a Tk file handler is used where Tk can
+    watch files. Otherwise other threads only set a flag, which the Tk
+    thread polls every frame, since Tk calls are not safe from them.
+    Either way the function only ever runs in the Tk thread.
+    """
+
+    def __init__(self, root: tk.Tk, function):
+        """Initialize the wakeup for a root and function."""
+        self.root = root
+        self.function = function
+        self.read = self.write = None
+        self.pending = False
+        try:
+            self.read, self.write = os.pipe()
+            os.set_blocking(self.read, False)
+            os.set_blocking(self.write, False)
+            root.tk.createfilehandler(self.read, tk.READABLE, self.on_readable)
+        except (AttributeError, RuntimeError, tk.TclError, OSError):
+            # Windows and some Tcl builds cannot watch files
+            self.close()
+            root.after(FRAME, self.poll)
+        logging.info("%s: using %s", self, "pipe" if self.read is not None else "polling")
+
+    def __repr__(self):
+        """Represent the wakeup as a string."""
+        return "Wakeup"
+
+    def __call__(self):
+        """Wake the Tk loop from any thread."""
+        if self.write is not None:
+            try:
+                os.write(self.write, b"\0")
+            except BlockingIOError:
+                # The pipe is already full of wakeups
+                pass
+        else:
+            self.pending = True
+
+    def on_readable(self, file: int, mask: int):
+        """Called by Tk when the pipe has wakeups in it."""
+        try:
+            os.read(self.read, 4096)
+        except BlockingIOError:
+            pass
+        self.function()
+
+    def poll(self):
+        """Called by Tk every frame when there is no pipe."""
+        if self.pending:
+            self.pending = False
+            self.function()
+        self.root.after(FRAME, self.poll)
+
+    def close(self):
+        """Close the pipe if there is one."""
+        if self.read is not None:
+            try:
+                self.root.tk.deletefilehandler(self.read)
+            except (AttributeError, tk.TclError):
+                pass
+        for file in (self.read, self.write):
+            if file is not None:
+                os.close(file)
+        self.read = self.write = None
+
+
+class Run:
+    """Coalesced run of client updates between other events.
+
+    Only the last position and direction of each player matter, and of
+    the letters written to a cell only the write that wins the cell's
+    register, so everything else in the run can be dropped.
+    """
+
+    def __init__(self):
+        """Initialize an empty run."""
+        self.players = {}
+        self.cells = {}
+        self.received = 0
+
+    def add(self, pid: int, update: dict):
+        """Add the update of a player to the run."""
+        for key, value in update.items():
+            self.received += 1
+            if key == LETTER:
+                x, y, letters, stamp = value
+                current = self.cells.get((x, y))
+                if current is None or (stamp, pid) > (current[1][3], current[0]):
+                    self.cells[x, y] = pid, value
+            else:
+                self.players.setdefault(pid, {})[key] = value
+
+    def events(self) -> list:
+        """Get the client updates that are left."""
+        events = [(CLIENT_UPDATED, (pid, update)) for pid, update in self.players.items()]
+        events.extend((CLIENT_UPDATED, (pid, {LETTER: value})) for pid, value in self.cells.values())
+        return events
+
+    def kept(self) -> int:
+        """Count the updates that are left."""
+        return sum(map(len, self.players.values())) + len(self.cells)
+
+
+class Dispatcher:
+    """Frame-budgeted handler of queued network events.
+
+    Every frame takes everything queued so far and coalesces the runs
+    of client updates between other events, which keep their order.
+    Events are then handled until the time budget runs out and the
+    rest wait for the next frame. The counts of events received,
+    coalesced away, and applied are kept for the last frame and in
+    total.
+    """
+
+    def __init__(self, q: queue.Queue, bindings: dict, budget: float):
+        """Initialize the dispatcher with a queue and bindings."""
+        self.queue = q
+        self.bindings = bindings
+        self.budget = budget
+        self.pending = collections.deque()
+        self.frame = collections.Counter()
+        self.total = collections.Counter()
+
+    def __repr__(self):
+        """Represent the dispatcher as a string."""
+        return "Dispatcher"
+
+    def collect(self):
+        """Move the queued events to the pending events."""
+        run = None
+        while True:
+            try:
+                event, data = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self.frame["received"] += 1
+            if event == CLIENT_UPDATED:
+                run = run or Run()
+                run.add(*data)
+                continue
+            self.flush(run)
+            run = None
+            self.pending.append((event, data))
+        self.flush(run)
+
+    def flush(self, run: Run):
+        """Add the updates left in a run to the pending events."""
+        if run is not None:
+            self.frame["coalesced"] += run.received - run.kept()
+            self.pending.extend(run.events())
+
+    def update(self) -> bool:
+        """Handle pending events within the budget and check for more."""
+        self.frame.clear()
+        self.collect()
+        deadline = time.perf_counter() + self.budget
+        # At least one event is handled every frame
+        while self.pending:
+            event, data = self.pending.popleft()
+            function = self.bindings.get(event)
+            if function is None:
+                logging.error("%s: caught event '%s' with no binding", self, event)
+            else:
+                function(data)
+            self.frame["applied"] += 1
+            if time.perf_counter() > deadline:
+                break
+        self.total.update(self.frame)
+        return bool(self.pending)
+
+
 # Logging
 class Controller:
 
@@ -52,16 +229,22 @@ class Controller:
         # Connection
         self.connection.queue(self.queue)
         self.connection.start()
-        self.connection.emit(CLIENT_JOINED, result)
+        # Offer to receive compressed messages
+        self.connection.emit(CLIENT_JOINED, {**result, COMPRESSION: settings.network.compression.enabled})
         logging.info("%s: started server handshake", self)
 
         # Main contents
         self.player = _model.PlayerModel(**result)
-        self.players = []
+        self.players = _model.PlayersAccess([self.player])
         self.view = _view.View()
         self.model = None
         logging.info("%s: created models and view", self)
 
+        # Handle network events as soon as they arrive
+        self.dispatcher = Dispatcher(self.queue, self.bindings, settings.network.client.budget / 1000)
+        self.wakeup = Wakeup(self.view.root, self.update)
+        self.connection.notify(self.wakeup)
+
         # Sub-controllers
         self.header = HeaderController(self)
         self.puzzle = PuzzleController(self)
@@ -93,32 +276,27 @@ class Controller:
         logging.info("%s: load", self)
 
     def update(self):
-        """Update the controller."""
-        if not self.queue.empty():
-            event, data = self.queue.get()
-            function = self.bindings.get(event)
-            if function is None:
-                logging.error("%s: caught event '%s' with no binding", self, event)
-            else:
-                function(data)
-        self.view.root.after(50, self.update)
+        """Handle the queued events within the frame budget."""
+        if self.dispatcher.update():
+            # Leave the rest for the next frame so drawing can catch up
+            self.view.root.after(FRAME, self.update)
 
     def main(self):
         """Run the old application."""
+        # Events from before the wakeup was set up
         self.update()
         logging.info("%s: starting runtime", self)
         self.view.main()
         self.connection.stop()
+        self.wakeup.close()
 
     def bind(self, event, function):
         """Bind a function to a network event."""
         self.bindings[event] = function
 
     def get_player(self, pid):
-        """Get a player by his idea."""
-        for player in [self.player] + self.players:
-            if player.id == pid:
-                return player
+        """Get a player by their id."""
+        return self.players.get(pid)
 
     def on_client_joined(self, data):
         """Called when a client joins the server."""
@@ -128,12 +306,20 @@ class Controller:
         """Called when the server sends out updates."""
         for key in data:
             if key == CLIENTS:
-                print("Received clients: ", data[CLIENTS])
-                self.players = data[CLIENTS]
+                # The local player replaces its copy from the server
+                self.players = _model.PlayersAccess(data[CLIENTS])
+                self.players.add(self.player)
+                logging.info("%s: received %i clients", self, len(self.players))
             elif key == ID:
+                self.players.remove(self.player.id)
                 self.player.id = data[ID]
+                self.players.add(self.player)
                 self.view.root.title("Joined as %s" % self.player[NAME])
                 self.view.show()
+            elif key == COMPRESSION:
+                # Only compress once the server accepts it
+                self.connection.compression = data[COMPRESSION]
+                logging.info("%s: server %s compression", self, "accepted" if data[COMPRESSION] else "declined")
             else:
                 logging.error("%s: received invalid server update '%s'", self, key)
 
@@ -174,10 +360,9 @@ class Controller:
                 player.direction = direction
             elif key == LETTER:
                 letter = data[LETTER]
-                x, y, letters = letter
-                self.model.cells[x, y].letters = letters
-                self.model.cells[x, y].owner = player.id
-                self.puzzle.draw(self.model.cells[x, y])
+                x, y, letters, stamp = letter
+                if self.model.merge(x, y, letters, player.id, stamp):
+                    self.puzzle.draw(self.model.cells[x, y])
             else:
                 logging.error("%s: received an invalid key '%s' from client update", self, key)
 
@@ -229,6 +414,8 @@ class PuzzleController(SubController):
         """Initialize the puzzle controller."""
         super().__init__(parent)
         self.view = self.parent.view.puzzle
+        # Canvas drawings of each cell by index
+        self.drawings = []
         # Bindings
         self.view.canvas.bind("<Button-1>", self.on_left_click)
         self.view.canvas.bind("<BackSpace>", self.on_backspace)
@@ -250,6 +437,7 @@ class PuzzleController(SubController):
         """Load the puzzle."""
         d = settings.appearance.puzzle.bg
         e = settings.appearance.puzzle.highlight.empty
+        self.drawings = [[] for cell in self.model.cells]
         for cell in self.model.cells:
             cell.update(fill=d if cell.kind == LETTER else e)
             self.draw(cell)
@@ -260,15 +448,17 @@ class PuzzleController(SubController):
     def draw(self, model: (_model.CellModel, _model.WordModel, _model.PlayerModel), **options):
         """Draw a model on the puzzle view."""
         # Draw a cell model
-        if isinstance(model, _model.CellModel):
+        if isinstance(model, (_model.CellModel, _model.CellView)):
             # Delete the previous drawings
-            self.view.canvas.delete(*list(model.drawings))
-            # Get size and position
             x, y = model.x, model.y
+            drawings = self.drawings[_model.to_index(x, y, self.model.width)]
+            self.view.canvas.delete(*drawings)
+            drawings.clear()
+            # Get size and position
             s = settings.appearance.puzzle.cell.size
             bbox = (x*s, y*s, (x+1)*s, (y+1)*s)
             # Draw a rectangle
-            model.drawings.box = self.view.canvas.create_rectangle(*bbox, fill=model.fill)
+            drawings.append(self.view.canvas.create_rectangle(*bbox, fill=model.fill))
             # Draw the letters
             if model.letters:
                 # Get the letters, position, font, and color
@@ -276,10 +466,9 @@ class PuzzleController(SubController):
                 pos = (x*s + h, y*s + h)
                 letters = model.letters
                 font = (settings.appearance.puzzle.font[0], int(s / (1.1 + 0.6*len(model.letters)))-3)
-                player = self.parent.get_player(model.owner)
-                color = settings.appearance.puzzle.fg if not player else player[COLOR]
+                color = self.parent.players.color(model.owner, settings.appearance.puzzle.fg)
                 # Draw the letters
-                model.drawings.letters = self.view.canvas.create_text(*pos, text=letters, font=font, fill=color)
+                drawings.append(self.view.canvas.create_text(*pos, text=letters, font=font, fill=color))
             # Draw cell number
             if model.number:
                 # Get position, number, and font
@@ -287,7 +476,7 @@ class PuzzleController(SubController):
                 number = model.number
                 font = (settings.appearance.puzzle.font[0], int(s / 3.5)-2)
                 # Draw the number
-                model.drawings.number = self.view.canvas.create_text(*pos, text=number, font=font, anchor=tk.W)
+                drawings.append(self.view.canvas.create_text(*pos, text=number, font=font, anchor=tk.W))
         # Draw a word by drawing each cell
         elif isinstance(model, _model.WordModel):
             for cell in model.cells:
@@ -335,64 +524,35 @@ class PuzzleController(SubController):
 
     def move_cell(self, distance: int=1, absolute: bool=False):
         """Move the current cell by a set distance."""
-        # Set constants for access
-        step = -1 if distance < 0 else 1
-        across = self.player.direction == ACROSS
-        down = self.player.direction == DOWN
-        x, y = self.player.x, self.player.y
-        # Move while not complete
-        while distance != 0:
-            x += step * across
-            y += step * down
-            # Fix bound issues
-            while not (0 <= x < self.model.width and 0 <= y < self.model.height):
-                # Bounding rules
-                if x < 0:
-                    x = self.model.width - 1
-                    y = (y - (not absolute)) % self.model.height
-                elif x >= self.model.width:
-                    x = 0
-                    y = (y + (not absolute)) % self.model.height
-                elif y < 0:
-                    y = self.model.height - 1
-                    x = (x - (not absolute)) % self.model.width
-                elif y >= self.model.height:
-                    y = 0
-                    x = (x + (not absolute)) % self.model.width
-            # Subtract the step if the crossword cell is a letter cell
-            if self.model.cells[x, y].kind == LETTER:
-                distance -= step
+        index = _model.to_index(self.player.x, self.player.y, self.model.width)
+        index = self.model.navigation.move(index, self.player.direction, distance, absolute)
         # Select a crossword cell
-        self.select_cell(x, y)
+        self.select_cell(*_model.to_position(index, self.model.width))
 
     def move_word(self, count=1):
         """Move the currently selected word to the next in the list."""
-        # Get the cell and direction
-        cell = self.model.cells[self.player.x, self.player.y]
-        direction = self.player.direction
-        # Get the word index and add the count
-        index = (self.model.words[direction].index(cell.word[direction]) + count)
-        index %= len(self.model.words[direction])
+        index = _model.to_index(self.player.x, self.player.y, self.model.width)
+        index = self.model.navigation.skip(index, self.player.direction, count)
         # Select a new cell
-        cell = self.model.words[direction][index].cells[0]
-        self.select_cell(cell.x, cell.y)
+        self.select_cell(*_model.to_position(index, self.model.width))
 
     def insert_letter(self, letter: str):
         """Insert a different letter in the currently selected cell."""
-        # Change the owner
         cell = self.model.cells[self.player.x, self.player.y]
-        cell.owner = self.player.id
+        letters = cell.letters
         # If the letter is a space
         if letter == " ":
-            cell.letters = ""
+            letters = ""
         # If the letter is lowercase change normally
         elif letter in string.ascii_lowercase:
-            cell.letters = letter.upper()
+            letters = letter.upper()
         # Otherwise, add it
         elif letter in string.ascii_uppercase:
-            cell.letters += letter.upper()
+            letters += letter.upper()
+        # Change the letters and owner
+        stamp = self.model.edit(self.player.x, self.player.y, letters, self.player.id)
         # Update the server
-        self.parent.connection.emit(CLIENT_UPDATED, {LETTER: (self.player.x, self.player.y,  cell.letters)})
+        self.parent.connection.emit(CLIENT_UPDATED, {LETTER: (self.player.x, self.player.y, cell.letters, stamp)})
         # Draw the cell
         self.draw(cell)
 
@@ -400,10 +560,10 @@ class PuzzleController(SubController):
         """Remove a letter from the current cell."""
         # Get the current cell
         cell = self.model.cells[self.player.x, self.player.y]
-        # Remove a letter
-        cell.letters = cell.letters[:-1]
+        # Remove a letter, which the remover now owns
+        stamp = self.model.edit(self.player.x, self.player.y, cell.letters[:-1], self.player.id)
         # Update the server
-        self.parent.connection.emit(CLIENT_UPDATED, (self.player.x, self.player.y, cell.letters))
+        self.parent.connection.emit(CLIENT_UPDATED, {LETTER: (self.player.x, self.player.y, cell.letters, stamp)})
         # Draw the current cell
         self.draw(cell)
 
@@ -496,16 +656,15 @@ class CluesController(SubController):
 
     def set_clue(self, word):
         """Set the current clue based on a word."""
-        if word in self.model.words.across:
+        index = self.model.words.index(word)
+        if word.direction == ACROSS:
             self.view.across_listbox.selection_clear(0, tk.END)
-            index = self.model.words.across.index(word)
             self.view.across_listbox.selection_set(index)
             self.view.across_listbox.see(index)
         else:
             self.view.down_listbox.selection_clear(0, tk.END)
-            index = self.model.words.down.index(word)
             self.view.down_listbox.selection_set(index)
-            self.view.across_listbox.see(index)
+            self.view.down_listbox.see(index)
 
     def on_across_left_click(self, event):
         """Called when the user left clicks on the across list."""
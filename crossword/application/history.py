@@ -0,0 +1,277 @@
+"""Crossword board history.
+
+The letters and owners of a board are kept in rows that are copied
+on write. A snapshot shares every row that has not changed since it
+was taken, so taking one is constant time and two snapshots can be
+compared by skipping the rows they still share. Changes are recorded
+in a compact journal that folds its oldest entries into a board, and
+concurrent writes to a cell are settled by last-writer-wins registers.
+"""
+
+# Import
+import array
+import struct
+from crossword.constants import *
+
+# Journal records kept before compaction
+LIMIT = 4096
+
+# Remote timestamps accepted, leaving local clocks room to tick
+STAMPS = 2**31
+
+
+class Snapshot:
+    """Letters and owners of a board at one point in time."""
+
+    __slots__ = ("chunks", "size", "chunk")
+
+    def __init__(self, chunks: list, size: int, chunk: int):
+        """Initialize a snapshot from its rows."""
+        self.chunks = chunks
+        self.size = size
+        self.chunk = chunk
+
+    def __len__(self):
+        """Get the number of cells in the snapshot."""
+        return self.size
+
+    def read(self, index: int) -> tuple:
+        """Get the letters and owner of a cell by its index."""
+        letters, owners = self.chunks[index // self.chunk]
+        return letters[index % self.chunk], owners[index % self.chunk]
+
+    def fill(self) -> tuple:
+        """Get the letters and owners of every cell."""
+        letters = []
+        owners = array.array("Q")
+        for chunk in self.chunks:
+            letters.extend(chunk[0])
+            owners.extend(chunk[1])
+        return letters, owners
+
+    def diff(self, other) -> list:
+        """Get the indices of the cells that differ from another snapshot."""
+        changed = []
+        for i, (a, b) in enumerate(zip(self.chunks, other.chunks)):
+            # Shared rows cannot have changed
+            if a is b:
+                continue
+            for j in range(len(a[0])):
+                if a[0][j] != b[0][j] or a[1][j] != b[1][j]:
+                    changed.append(i*self.chunk + j)
+        return changed
+
+
+class Board(Snapshot):
+    """Live letters and owners of a board in copy-on-write rows.
+
+    Every row remembers the epoch it was copied in. Taking a snapshot
+    starts a new epoch, which makes every row shared without touching
+    them, and a row is only copied the first time it is written to in
+    the new epoch.
+    """
+
+    __slots__ = ("epochs", "epoch", "shared")
+
+    def __init__(self, size: int, chunk: int, origin: Snapshot=None):
+        """Initialize a board split into rows of a chunk size, empty or from a snapshot."""
+        if origin is None:
+            lengths = [min(chunk, size - i) for i in range(0, size, chunk)]
+            super().__init__([([""] * n, array.array("Q", bytes(8 * n))) for n in lengths], size, chunk)
+        else:
+            super().__init__(origin.chunks[:], size, chunk)
+        # Rows shared with a snapshot are from before the first epoch
+        self.epochs = [0 if origin is None else -1] * len(self.chunks)
+        self.epoch = 0
+        self.shared = False
+
+    def snapshot(self) -> Snapshot:
+        """Take a snapshot of the board."""
+        self.epoch += 1
+        self.shared = True
+        return Snapshot(self.chunks, self.size, self.chunk)
+
+    def write(self, index: int, letters: str, owner=None):
+        """Change the letters and owner of a cell by its index."""
+        i, j = divmod(index, self.chunk)
+        # The list of rows is shared with the last snapshot
+        if self.shared:
+            self.chunks = self.chunks[:]
+            self.shared = False
+        if self.epochs[i] != self.epoch:
+            chunk = self.chunks[i]
+            self.chunks[i] = (chunk[0][:], array.array("Q", chunk[1]))
+            self.epochs[i] = self.epoch
+        chunk = self.chunks[i]
+        chunk[0][j] = letters
+        chunk[1][j] = owner or 0
+
+    def load(self, letters: list, owners: array.array):
+        """Replace the letters and owners of every cell at once."""
+        chunk = self.chunk
+        self.chunks = [(letters[i:i+chunk], owners[i:i+chunk]) for i in range(0, self.size, chunk)]
+        self.epochs = [self.epoch] * len(self.chunks)
+        self.shared = False
+
+
+class Journal:
+    """Append-only journal of letter, position, and direction changes.
+
+    Every change gets the next sequence number and is packed into a
+    fixed-size record, so the changes since any sequence number are a
+    single slice of the records. Letters are stored as indices into a
+    table of the distinct strings written. Once the journal grows past
+    its limit, the oldest half is folded into a board and player state
+    so memory stays bounded, and changes from before that can only be
+    caught up on from the state. The board is only made at the first
+    compaction, from the snapshot the journal started at if any.
+    """
+
+    # Player id, cell index, value, kind
+    RECORD = struct.Struct("<QIIBxxx")
+    KINDS = (LETTER, POSITION, DIRECTION)
+    DIRECTIONS = (ACROSS, DOWN)
+
+    def __init__(self, size: int, chunk: int, limit: int=LIMIT, origin: Snapshot=None):
+        """Initialize a journal for a board, empty or starting at a snapshot."""
+        self.records = bytearray()
+        self.limit = limit
+        self.size = size
+        self.chunk = chunk
+        # Sequence number of the first record
+        self.base = 0
+        # State before the first record
+        self.origin = origin
+        self.board = None
+        self.players = {}
+        # Table of letters written
+        self.strings = []
+        self.ids = {}
+
+    def __len__(self):
+        """Get the number of records in the journal."""
+        return len(self.records) // self.RECORD.size
+
+    @property
+    def seq(self) -> int:
+        """Get the sequence number of the next change."""
+        return self.base + len(self)
+
+    def append(self, kind: str, player: int, index: int, value: int) -> int:
+        """Append a change record and get its sequence number."""
+        seq = self.seq
+        self.records += self.RECORD.pack(player or 0, index, value, self.KINDS.index(kind))
+        if len(self.records) > self.limit * self.RECORD.size:
+            self.compact(len(self) - self.limit // 2)
+        return seq
+
+    def letter(self, index: int, letters: str, owner=None) -> int:
+        """Record the letters and owner written to a cell."""
+        value = self.ids.get(letters)
+        if value is None:
+            value = self.ids[letters] = len(self.strings)
+            self.strings.append(letters)
+        return self.append(LETTER, owner, index, value)
+
+    def position(self, player: int, index: int) -> int:
+        """Record a player moving to a cell."""
+        return self.append(POSITION, player, index, 0)
+
+    def direction(self, player: int, direction: str) -> int:
+        """Record a player changing direction."""
+        return self.append(DIRECTION, player, 0, self.DIRECTIONS.index(direction))
+
+    def decode(self, player: int, index: int, value: int, kind: int) -> tuple:
+        """Decode the kind and value of an unpacked record."""
+        kind = self.KINDS[kind]
+        if kind == LETTER:
+            return kind, player, index, self.strings[value]
+        elif kind == DIRECTION:
+            return kind, player, index, self.DIRECTIONS[value]
+        return kind, player, index, None
+
+    def since(self, seq: int) -> list:
+        """Get the changes from a sequence number on.
+
+        Changes are given as sequence number, kind, player id, cell
+        index, and value. None is returned if the changes have already
+        been compacted away.
+        """
+        if seq < self.base:
+            return None
+        records = self.RECORD.iter_unpack(self.records[(seq - self.base) * self.RECORD.size:])
+        return [(i,) + self.decode(*record) for i, record in enumerate(records, seq)]
+
+    def compact(self, count: int):
+        """Fold the oldest records into the journal state."""
+        count = min(count, len(self))
+        if self.board is None:
+            self.board = Board(self.size, self.chunk, self.origin)
+            self.origin = None
+        for record in self.RECORD.iter_unpack(self.records[:count * self.RECORD.size]):
+            kind, player, index, value = self.decode(*record)
+            if kind == LETTER:
+                self.board.write(index, value, player)
+            elif kind == POSITION:
+                self.players.setdefault(player, [0, ACROSS])[0] = index
+            elif kind == DIRECTION:
+                self.players.setdefault(player, [0, ACROSS])[1] = value
+        # Rebuild the table of letters from the records left so it stays bounded
+        records = bytearray()
+        strings = []
+        ids = {}
+        for player, index, value, kind in self.RECORD.iter_unpack(self.records[count * self.RECORD.size:]):
+            if self.KINDS[kind] == LETTER:
+                letters = self.strings[value]
+                value = ids.get(letters)
+                if value is None:
+                    value = ids[letters] = len(strings)
+                    strings.append(letters)
+            records += self.RECORD.pack(player, index, value, kind)
+        self.records, self.strings, self.ids = records, strings, ids
+        self.base += count
+
+    def state(self) -> tuple:
+        """Get the sequence number, board snapshot, and players of the state."""
+        players = {player: tuple(state) for player, state in self.players.items()}
+        if self.board is not None:
+            return self.base, self.board.snapshot(), players
+        return self.base, self.origin or Board(self.size, self.chunk).snapshot(), players
+
+
+class Registers:
+    """Last-writer-wins registers over the cells of a board.
+
+    Each cell keeps the Lamport timestamp and player id of the write
+    it holds. Another write only replaces it if its timestamp is later,
+    or the same and from a higher player id, so replicas that receive
+    the same writes in any order end up with the same board. Local
+    writes are stamped from a clock that moves past every timestamp
+    seen, so they win over everything the replica already holds.
+    Timestamps past STAMPS are rejected so no write can push a clock
+    to the end of the stamp array's range.
+    """
+
+    __slots__ = ("stamps", "writers", "clock")
+
+    def __init__(self, size: int, stamps: array.array=None, writers: array.array=None):
+        """Initialize the registers, optionally from existing stamps."""
+        self.stamps = array.array("I", stamps or bytes(4 * size))
+        self.writers = array.array("Q", writers or bytes(8 * size))
+        self.clock = max(self.stamps, default=0)
+
+    def tick(self) -> int:
+        """Get the timestamp of a new local write."""
+        self.clock += 1
+        return self.clock
+
+    def merge(self, index: int, stamp: int, writer=None) -> bool:
+        """Check whether a write wins its cell and record it if so."""
+        if type(stamp) is not int or not 0 <= stamp < STAMPS:
+            return False
+        self.clock = max(self.clock, stamp)
+        if (stamp, writer or 0) <= (self.stamps[index], self.writers[index]):
+            return False
+        self.stamps[index] = stamp
+        self.writers[index] = writer or 0
+        return True
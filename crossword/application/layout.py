@@ -0,0 +1,301 @@
+"""Crossword derived layout cache.
+
+Clue numbering and the links between words and cells only depend on the
+shape of the grid, so they are computed once per grid, kept as flat
+arrays, and saved in a compact binary form to be loaded in bulk.
+"""
+
+# Import
+import os
+import sys
+import array
+import struct
+import hashlib
+import collections
+from crossword import puz
+from crossword.constants import *
+
+# Binary layout header: width, height, across word count, down word count
+HEADER = ">HHHH"
+VERSION = 3
+
+# Layouts kept in memory
+SIZE = 64
+
+# Fill bytes translated to the black square mask
+MASK = bytes(c == ord(puz.BLACKSQUARE) for c in range(256))
+
+
+def grid(puzzle: puz.Puzzle) -> bytes:
+    """Get the black square mask of a puzzle."""
+    return puzzle.fill.encode(puz.ENCODING).translate(MASK)
+
+
+def digest(puzzle: puz.Puzzle) -> str:
+    """Get the digest of the grid shape of a puzzle."""
+    shape = struct.pack(">HHH", VERSION, puzzle.width, puzzle.height) + grid(puzzle)
+    return hashlib.sha1(shape).hexdigest()
+
+
+def _pack(values: array.array) -> bytes:
+    """Pack an array in little endian order."""
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(typecode: str, data: bytes) -> array.array:
+    """Unpack an array from little endian order."""
+    values = array.array(typecode, data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class Layout:
+    """Numbering and word links of a grid as flat arrays.
+
+    Words are ordered across then down like the clue lists. Each word
+    has a number, a clue index, and a range in the cells array given
+    by its offsets. Every cell maps back to its across and down word,
+    or -1 if it has none. Navigation tables are built on first use and
+    are never saved.
+    """
+
+    def __init__(self, width: int, height: int, across: int, grid: bytes):
+        """Initialize an empty layout."""
+        self.width = width
+        self.height = height
+        self.across = across
+        self.grid = grid
+        self.numbers = array.array("H")
+        self.clues = array.array("H")
+        self.offsets = array.array("I", [0])
+        self.cells = array.array("I")
+        self.across_of = array.array("i", [-1]) * (width*height)
+        self.down_of = array.array("i", [-1]) * (width*height)
+        self._navigation = None
+        self._slices = None
+
+    def __len__(self):
+        """Get the number of words in the layout."""
+        return len(self.numbers)
+
+    def word(self, i: int) -> array.array:
+        """Get the cell indices of a word."""
+        return self.cells[self.offsets[i]:self.offsets[i+1]]
+
+    @property
+    def slices(self) -> list:
+        """Get each word's cells as a slice of the grid, a row or a column apart."""
+        if self._slices is None:
+            steps = (1,) * self.across + (self.width,) * (len(self) - self.across)
+            ends = zip(self.offsets, self.offsets[1:], steps)
+            self._slices = [slice(self.cells[start], self.cells[end-1] + 1, step) for start, end, step in ends]
+        return self._slices
+
+    @property
+    def navigation(self):
+        """Get the navigation tables of the layout."""
+        if self._navigation is None:
+            self._navigation = Navigation(self)
+        return self._navigation
+
+    @classmethod
+    def compute(cls, puzzle: puz.Puzzle):
+        """Compute the layout of a puzzle from its clue numbering."""
+        # Number with clue indices in place of the clues themselves
+        indices = range(2 * len(puzzle.fill))
+        numbering = puz.DefaultClueNumbering(puzzle.fill, indices, puzzle.width, puzzle.height)
+        layout = cls(puzzle.width, puzzle.height, len(numbering.across), grid(puzzle))
+        for info in numbering.across:
+            layout.add(info, 1, layout.across_of)
+        for info in numbering.down:
+            layout.add(info, puzzle.width, layout.down_of)
+        return layout
+
+    def add(self, info: dict, step: int, owners: array.array):
+        """Add a word from its numbering info."""
+        i = len(self.numbers)
+        self.numbers.append(info["num"])
+        self.clues.append(info["clue"])
+        for j in range(info["cell"], info["cell"] + info["len"]*step, step):
+            self.cells.append(j)
+            owners[j] = i
+        self.offsets.append(len(self.cells))
+
+    def tobytes(self) -> bytes:
+        """Pack the layout into its binary form."""
+        header = struct.pack(HEADER, self.width, self.height, self.across, len(self) - self.across)
+        arrays = (self.numbers, self.clues, self.offsets, self.cells, self.across_of, self.down_of)
+        return header + self.grid + b"".join(map(_pack, arrays))
+
+    @classmethod
+    def frombytes(cls, data: bytes):
+        """Load a layout from its binary form, raising ValueError if it is malformed."""
+        position = struct.calcsize(HEADER)
+        if len(data) < position:
+            raise ValueError("layout is truncated")
+        width, height, across, down = struct.unpack_from(HEADER, data)
+        size = width*height
+        count = across + down
+        layout = cls(width, height, across, data[position:position+size])
+        # Every array size follows from the header except the cells, given by the offsets
+        lengths = [("numbers", count), ("clues", count), ("offsets", count + 1)]
+        if len(data) < position + size + 8*count + 4:
+            raise ValueError("layout is truncated")
+        end = position + size + 4*count
+        cells = _unpack("I", data[end + 4*count:end + 4*count + 4])[0]
+        lengths += [("cells", cells), ("across_of", size), ("down_of", size)]
+        if len(data) != end + 4*(count + 1) + 4*cells + 8*size:
+            raise ValueError("layout is truncated")
+        # Bulk load the arrays
+        position += size
+        for name, length in lengths:
+            typecode = getattr(layout, name).typecode
+            end = position + length * array.array(typecode).itemsize
+            setattr(layout, name, _unpack(typecode, data[position:end]))
+            position = end
+        # Check the ranges before trusting them as indices
+        offsets = layout.offsets
+        if offsets[0] != 0 or list(offsets) != sorted(offsets):
+            raise ValueError("layout has invalid word ranges")
+        if max(layout.cells, default=0) >= size:
+            raise ValueError("layout has cells outside the grid")
+        for owners in (layout.across_of, layout.down_of):
+            if size and (min(owners) < -1 or max(owners) >= count):
+                raise ValueError("layout has cells in unknown words")
+        return layout
+
+
+class Navigation:
+    """Precomputed movement tables for a puzzle grid.
+
+    For every cell, direction, and bounding mode there is a table of
+    the next and previous letter cell, and for every direction a table
+    of the first cell of the next and previous word. Moving the
+    selection is then one lookup per step. Wrapping moves continue on
+    the next row or column at the edge of the grid, while absolute
+    moves stay in the same row or column. A cell with nowhere to go
+    maps to -1.
+    """
+
+    def __init__(self, layout):
+        """Build the movement tables of a layout."""
+        w, h = layout.width, layout.height
+        letter = [not black for black in layout.grid]
+        rows = [list(range(y*w, (y+1)*w)) for y in range(h)]
+        columns = [list(range(x, w*h, w)) for x in range(w)]
+        # Cyclic orders of cells for each direction and mode
+        orders = {
+            (ACROSS, False): [sum(rows, [])],
+            (ACROSS, True): rows,
+            (DOWN, False): [sum(columns, [])],
+            (DOWN, True): columns}
+        self.cells = {}
+        for key, cycles in orders.items():
+            following = array.array("i", [-1]) * (w*h)
+            preceding = array.array("i", [-1]) * (w*h)
+            for cycle in cycles:
+                self.follow(cycle, letter, following)
+                self.follow(cycle[::-1], letter, preceding)
+            self.cells[key] = {1: following, -1: preceding}
+        # First cells of the neighboring words
+        self.words = {}
+        for direction, first, last, owners in (
+                (ACROSS, 0, layout.across, layout.across_of),
+                (DOWN, layout.across, len(layout), layout.down_of)):
+            count = last - first
+            starts = [layout.cells[layout.offsets[i]] for i in range(first, last)]
+            following = array.array("i", [-1]) * (w*h)
+            preceding = array.array("i", [-1]) * (w*h)
+            for i, word in enumerate(owners):
+                if word >= 0:
+                    following[i] = starts[(word - first + 1) % count]
+                    preceding[i] = starts[(word - first - 1) % count]
+            self.words[direction] = {1: following, -1: preceding}
+
+    @staticmethod
+    def follow(cycle: list, letter: list, table: array.array):
+        """Fill in the next letter cell after each cell of a cycle."""
+        nearest = -1
+        # Walk backwards twice so the last cells wrap around to the first
+        for i in reversed(cycle * 2):
+            table[i] = nearest
+            if letter[i]:
+                nearest = i
+
+    def move(self, index: int, direction: str, distance: int, absolute: bool=False) -> int:
+        """Get the cell a distance of letter cells away."""
+        table = self.cells[direction, absolute][-1 if distance < 0 else 1]
+        for i in range(abs(distance)):
+            if table[index] < 0:
+                break
+            index = table[index]
+        return index
+
+    def skip(self, index: int, direction: str, count: int) -> int:
+        """Get the first cell of the word a count of words away."""
+        table = self.words[direction][-1 if count < 0 else 1]
+        for i in range(abs(count)):
+            if table[index] < 0:
+                break
+            index = table[index]
+        return index
+
+
+class LayoutCache:
+    """Layouts by grid digest, the most recently used kept in memory and all optionally on disk."""
+
+    def __init__(self, directory: str=None, size: int=SIZE):
+        """Initialize the layout cache with an optional directory."""
+        self.directory = directory
+        self.size = size
+        self.layouts = collections.OrderedDict()
+
+    def path(self, key: str) -> str:
+        """Get the file path of a cached layout."""
+        return os.path.join(self.directory, key + ".layout")
+
+    def get(self, puzzle: puz.Puzzle) -> Layout:
+        """Get the layout of a puzzle, computing it if it is unknown."""
+        key = digest(puzzle)
+        layout = self.layouts.get(key)
+        if layout is None and self.directory and os.path.exists(self.path(key)):
+            layout = self.load(key, puzzle)
+        if layout is None:
+            layout = Layout.compute(puzzle)
+            self.save(key, layout)
+        self.layouts[key] = layout
+        self.layouts.move_to_end(key)
+        if len(self.layouts) > self.size:
+            self.layouts.popitem(last=False)
+        return layout
+
+    def load(self, key: str, puzzle: puz.Puzzle) -> Layout:
+        """Read a layout from the cache directory, or None if it is unusable."""
+        with open(self.path(key), "rb") as file:
+            data = file.read()
+        try:
+            layout = Layout.frombytes(data)
+        except ValueError:
+            return None
+        # A layout for another grid is as good as corrupt
+        if (layout.width, layout.height, layout.grid) != (puzzle.width, puzzle.height, grid(puzzle)):
+            return None
+        return layout
+
+    def save(self, key: str, layout: Layout):
+        """Write a layout to the cache directory if there is one."""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary file first so readers never see half a layout
+        temporary = "%s.%i.tmp" % (self.path(key), os.getpid())
+        with open(temporary, "wb") as file:
+            file.write(layout.tobytes())
+        os.replace(temporary, self.path(key))
+
+
+cache = LayoutCache(LAYOUTS)
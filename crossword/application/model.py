@@ -4,9 +4,20 @@ Contains all containers and models used in the crossword application.
 """
 
 # Import
-import puz
+import array
+from crossword import puz
+from crossword.application import layout as _layout
+from crossword.application import history as _history
 from crossword.constants import *
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Fill bytes translated to the first letters of an empty board
+BLANKS = bytes(c if c == ord(EMPTY) else ord(BLANK) for c in range(256))
+
 
 # Convenience
 def to_position(i: int, w: int) -> tuple:
@@ -20,26 +31,73 @@ def to_index(x: int, y: int, w: int) -> int:
     return y*w + x
 
 
-class DrawingsModel:
-    """Basic container class for a canvas drawing group."""
-
-    def __init__(self):
-        """Initialize the canvas drawing group."""
-        self._ = []
+class ChecksumTracker:
+    """Incremental scrambled checksum of a locked puzzle's fill.
 
-    def __setattr__(self, key, value):
-        """Set and track an attribute of the drawing group."""
-        super().__setattr__(key, value)
-        self._.append(key)
+    Locked puzzles can only be checked by checksumming the fill in
+    column-major order without black squares. The tracker keeps that
+    stream as one byte array per column along with the running checksum
+    after each column. A change dirties only its own column, and later
+    columns are only redone until the running checksum is unchanged.
+    A board with blanks is rejected without checksumming at all.
+    """
 
-    def __iter__(self):
-        """Get all indices of the drawings in the model."""
-        return iter([item for item in self._ if item is not None])
+    def __init__(self, puzzle: puz.Puzzle):
+        """Initialize the tracker with an empty board."""
+        self.target = puzzle.scrambled_cksum
+        self.width = puzzle.width
+        # Map each letter cell to its column and offset in the stream
+        self.positions = {}
+        self.columns = [bytearray() for x in range(puzzle.width)]
+        for x in range(puzzle.width):
+            for y in range(puzzle.height):
+                i = to_index(x, y, puzzle.width)
+                if not puz.is_blacksquare(puzzle.fill[i]):
+                    self.positions[i] = x, len(self.columns[x])
+                    self.columns[x].append(ord(BLANK))
+        # Running checksum before each column and range of stale columns
+        self.prefix = [0] * (puzzle.width + 1)
+        self.dirty = 0
+        self.last = puzzle.width - 1
+        self.blank = len(self.positions)
+
+    def update(self, index: int, letters: str):
+        """Update the letter of a cell by its index, ignoring black squares."""
+        if index not in self.positions:
+            return
+        x, offset = self.positions[index]
+        column = self.columns[x]
+        byte = ord(letters[0] if letters else BLANK)
+        if column[offset] == byte:
+            return
+        # Keep track of blanks and the stale columns
+        self.blank += (byte == ord(BLANK)) - (column[offset] == ord(BLANK))
+        column[offset] = byte
+        self.dirty = min(self.dirty, x)
+        self.last = max(self.last, x)
+
+    def checksum(self) -> int:
+        """Get the scrambled checksum of the current fill."""
+        for x in range(self.dirty, self.width):
+            value = puz.data_cksum(self.columns[x], self.prefix[x])
+            # Past the stale columns an unchanged sum leaves the rest valid
+            if x > self.last and value == self.prefix[x+1]:
+                break
+            self.prefix[x+1] = value
+        self.dirty = self.width
+        self.last = -1
+        return self.prefix[self.width]
+
+    def solved(self) -> bool:
+        """Check whether the fill matches the locked solution."""
+        return not self.blank and self.checksum() == self.target
 
 
 class DualWordAccess:
     """Easy access to cell words."""
 
+    __slots__ = ("across", "down")
+
     def __init__(self):
         """Initialize a dual word access."""
         self.across = None
@@ -47,11 +105,18 @@ class DualWordAccess:
 
     def __getitem__(self, key):
         """Conveniently access the elements of the access."""
-        return {ACROSS: self.across, DOWN: self.down}[key]
+        # Directions are named after the attributes
+        return getattr(self, key)
 
 
 class CellModel:
-    """Basic container class for a single old cell."""
+    """Basic container class for a single old cell.
+
+    Drawing state is kept by the puzzle controller rather than the cell
+    so that cells stay small and free of process-local canvas ids.
+    """
+
+    __slots__ = ("x", "y", "kind", "word", "solution", "letters", "owner", "number", "fill")
 
     def __init__(self, x: int, y: int, kind: str, solution: str):
         """Initialize a crossword cell container."""
@@ -67,11 +132,6 @@ class CellModel:
         # Constant
         self.number = ""
         self.fill = "white"
-        # Drawing
-        self.drawings = DrawingsModel()
-        self.drawings.box = None
-        self.drawings.number = None
-        self.drawings.letter = None
 
     def update(self, **options):
         """Update the cells attributes."""
@@ -80,7 +140,10 @@ class CellModel:
 
 
 class CellsAccess:
-    """Basic matrix-like container for a old board's cells."""
+    """Basic matrix-like container for a old board's cells.
+
+    The fill is mirrored to a copy-on-write board for snapshots.
+    """
 
     def __init__(self, puzzle: puz.Puzzle):
         """Initialize a crossword cells container."""
@@ -91,6 +154,7 @@ class CellsAccess:
         for y, row in enumerate(zipped[i:i+puzzle.width] for i in range(0, len(zipped), puzzle.width)):
             for x, (kind, solution) in enumerate(row):
                 self.cells.append(CellModel(x, y, kind, solution))
+        self.board = _history.Board(len(self.cells), puzzle.width)
 
     def __getitem__(self, position: (int, tuple)):
         """Get a cell with its coordinate position."""
@@ -107,9 +171,277 @@ class CellsAccess:
         """Get the number of cells in the access."""
         return len(self.cells)
 
+    def select(self, indices) -> list:
+        """Get the cells at a sequence of indices."""
+        return [self.cells[i] for i in indices]
+
+    def link(self, words: list, layout: _layout.Layout):
+        """Link the cells to their words and numbers."""
+        for cell, across, down in zip(self.cells, layout.across_of, layout.down_of):
+            cell.word.across = words[across] if across >= 0 else None
+            cell.word.down = words[down] if down >= 0 else None
+        for word in words:
+            word.cells[0].number = word.number
+
+    def write(self, index: int, letters: str, owner=None) -> str:
+        """Change the letters and owner of a cell and get the old letters."""
+        cell = self.cells[index]
+        previous = cell.letters
+        cell.letters = letters
+        cell.owner = owner
+        self.board.write(index, letters, owner)
+        return previous
+
+    def load(self, letters: list, owners: array.array):
+        """Set the letters and owners of every cell at once."""
+        for cell, letter, owner in zip(self.cells, letters, owners):
+            cell.letters = letter
+            cell.owner = owner or None
+        self.board.load(list(letters), array.array("Q", owners))
+
+    def clear(self):
+        """Remove the letters and owners of every cell."""
+        for cell in self.cells:
+            cell.letters = ""
+            cell.owner = None
+        self.board.load([""] * len(self.cells), array.array("Q", bytes(8 * len(self.cells))))
+
+    def blanks(self) -> int:
+        """Count the letter cells that have no letters."""
+        return sum(cell.kind == LETTER and not cell.letters for cell in self.cells)
+
+    def incorrect(self) -> list:
+        """Get the indices of the filled cells that are wrong."""
+        return [i for i, cell in enumerate(self.cells) if cell.letters and cell.letters[0] != cell.solution]
+
+    def count(self, owner) -> int:
+        """Count the cells owned by a player."""
+        return sum(cell.owner == owner for cell in self.cells)
+
+    def fill(self) -> tuple:
+        """Get the letters and owners of every cell."""
+        letters = [cell.letters for cell in self.cells]
+        owners = array.array("Q", (cell.owner or 0 for cell in self.cells))
+        return letters, owners
+
+
+class CellView:
+    """Lightweight cell model view into an array cells access.
+
+    Views are made on demand and compare equal by access and index.
+    A view doubles as its own word access, so cell.word[direction]
+    works the same as it does for a cell model.
+    """
+
+    __slots__ = ("access", "index")
+
+    def __init__(self, access, index: int):
+        """Initialize a view of a cell in an array cells access."""
+        self.access = access
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, CellView) and self.access is other.access and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.access), self.index))
+
+    def __getitem__(self, key):
+        """Get the word of the cell in a direction."""
+        return getattr(self, key)
+
+    def update(self, **options):
+        """Update the cells attributes."""
+        for option in options.items():
+            setattr(self, *option)
+
+    @property
+    def x(self):
+        return self.index % self.access.width
+
+    @property
+    def y(self):
+        return self.index // self.access.width
+
+    @property
+    def kind(self):
+        return chr(self.access.kinds[self.index])
+
+    @property
+    def solution(self):
+        return self.access.solutions[self.index]
+
+    @property
+    def word(self):
+        return self
+
+    @property
+    def across(self):
+        i = self.access.layout.across_of[self.index]
+        return self.access.words[i] if i >= 0 else None
+
+    @property
+    def down(self):
+        i = self.access.layout.down_of[self.index]
+        return self.access.words[i] if i >= 0 else None
+
+    @property
+    def letters(self):
+        return self.access.board.read(self.index)[0]
+
+    @letters.setter
+    def letters(self, letters):
+        self.access.write(self.index, letters, self.owner)
+
+    @property
+    def owner(self):
+        return self.access.board.read(self.index)[1] or None
+
+    @owner.setter
+    def owner(self, owner):
+        self.access.write(self.index, self.letters, owner)
+
+    @property
+    def number(self):
+        return self.access.numbers[self.index] or ""
+
+    @number.setter
+    def number(self, number):
+        self.access.numbers[self.index] = number or 0
+
+    @property
+    def fill(self):
+        return self.access.fills[self.index] if self.access.fills else "white"
+
+    @fill.setter
+    def fill(self, fill):
+        # Only clients draw cells, so the fills are made on first use
+        if self.access.fills is None:
+            self.access.fills = ["white"] * len(self.access)
+        self.access.fills[self.index] = fill
+
+
+class CellsSlice:
+    """Sequence of cell views for a word in an array cells access."""
+
+    __slots__ = ("access", "indices")
+
+    def __init__(self, access, indices):
+        """Initialize the slice with the indices of its cells."""
+        self.access = access
+        self.indices = indices
+
+    def __getitem__(self, i: int) -> CellView:
+        return CellView(self.access, self.indices[i])
+
+    def __iter__(self):
+        return (CellView(self.access, i) for i in self.indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+
+class ArrayCellsAccess:
+    """Structure of arrays container for a old board's cells.
+
+    Instead of a cell model per cell, the access keeps parallel arrays
+    of every cell attribute indexed by to_index, and hands out views
+    for callers that want cell models. Whole board operations work on
+    the arrays directly. The full rebus letters and owners of the cells
+    are kept in the rows of a copy-on-write board, which snapshots are
+    taken from, and firsts holds the first letter byte of each cell,
+    which is what the board is checked against.
+    """
+
+    def __init__(self, puzzle: puz.Puzzle):
+        """Initialize a crossword cells container."""
+        self.width = puzzle.width
+        self.height = puzzle.height
+        self.solutions = puzzle.solution
+        self.kinds = bytearray(puzzle.fill.encode(puz.ENCODING))
+        self.blank = bytes(self.kinds.translate(BLANKS))
+        self.firsts = bytearray(self.blank)
+        self.board = _history.Board(len(self.kinds), puzzle.width)
+        self.numbers = array.array("H", bytes(2 * len(self.kinds)))
+        self.fills = None
+        # Linked by the words access
+        self.words = None
+        self.layout = None
+
+    def __getitem__(self, position: (int, tuple)) -> CellView:
+        """Get a cell view with its coordinate position."""
+        if isinstance(position, int):
+            return CellView(self, position)
+        elif isinstance(position, tuple) and len(position) == 2:
+            return CellView(self, to_index(position[0], position[1], self.width))
+
+    def __iter__(self):
+        """Iterate through views of the cells in the access."""
+        return (CellView(self, i) for i in range(len(self.kinds)))
+
+    def __len__(self):
+        """Get the number of cells in the access."""
+        return len(self.kinds)
+
+    def select(self, indices) -> CellsSlice:
+        """Get the cells at a sequence of indices."""
+        return CellsSlice(self, indices)
+
+    def link(self, words: list, layout: _layout.Layout):
+        """Link the cells to their words and numbers."""
+        self.words = words
+        self.layout = layout
+        for word, offset in zip(words, layout.offsets):
+            self.numbers[layout.cells[offset]] = word.number
+
+    def write(self, index: int, letters: str, owner=None) -> str:
+        """Change the letters and owner of a cell and get the old letters."""
+        previous = self.board.read(index)[0]
+        self.board.write(index, letters, owner)
+        self.firsts[index] = ord(letters[0]) if letters else ord(BLANK)
+        return previous
+
+    def load(self, letters: list, owners: array.array):
+        """Set the letters and owners of every cell at once."""
+        self.board.load(list(letters), array.array("Q", owners))
+        blank = self.blank.decode(puz.ENCODING)
+        self.firsts = bytearray("".join([letter[:1] or b for letter, b in zip(letters, blank)]).encode(puz.ENCODING))
+
+    def clear(self):
+        """Remove the letters and owners of every cell."""
+        self.board.load([""] * len(self.kinds), array.array("Q", bytes(8 * len(self.kinds))))
+        self.firsts[:] = self.blank
+
+    def blanks(self) -> int:
+        """Count the letter cells that have no letters."""
+        return self.firsts.count(ord(BLANK))
+
+    def incorrect(self) -> list:
+        """Get the indices of the filled cells that are wrong."""
+        solutions = self.solutions.encode(puz.ENCODING)
+        if numpy is not None:
+            firsts = numpy.frombuffer(bytes(self.firsts), numpy.uint8)
+            solutions = numpy.frombuffer(solutions, numpy.uint8)
+            return numpy.flatnonzero((firsts != solutions) & (firsts != ord(BLANK))).tolist()
+        return [i for i, a, b in zip(range(len(solutions)), self.firsts, solutions) if a != b and a != ord(BLANK)]
+
+    def count(self, owner) -> int:
+        """Count the cells owned by a player."""
+        return sum(owners.count(owner or 0) for letters, owners in self.board.chunks)
+
+    def fill(self) -> tuple:
+        """Get the letters and owners of every cell."""
+        return self.board.fill()
+
 
 class WordModel:
-    """Basic container class for a single old cell."""
+    """Basic container class for a single old cell.
+
+    The filled and correct counts of the word are kept up to date by
+    the puzzle model as letters are written.
+    """
+
+    __slots__ = ("direction", "number", "clue", "cells", "filled", "correct")
 
     def __init__(self, direction: str, number: int, clue: int):
         """Initialize a crossword cell container."""
@@ -118,6 +450,9 @@ class WordModel:
         self.number = number
         self.clue = clue
         self.cells = []
+        # Completion counters
+        self.filled = 0
+        self.correct = 0
 
     def update(self, **options):
         """Mass update the cells in the word."""
@@ -133,36 +468,24 @@ class WordsAccess:
         self.words = []
         self.across = []
         self.down = []
-        # Load the words
-        numbering = puzzle.clue_numbering()
-        for info in numbering.across:
-            x, y = to_position(info["cell"], puzzle.width)
-            linked = list(map(lambda j: cells[x+j, y], range(info["len"])))
-            word = WordModel(ACROSS, info["num"], info["clue"])
-            # Link the word and cells
-            word.cells = linked
-            for cell in linked:
-                cell.word.across = word
-            word.cells[0].number = word.number
-            # Add the word to the lists
-            self.words.append(word)
-            self.across.append(word)
-        for info in numbering.down:
-            x, y = to_position(info["cell"], puzzle.width)
-            linked = list(map(lambda j: cells[x, y+j], range(info["len"])))
-            word = WordModel(DOWN, info["num"], info["clue"])
-            # Link the word and cells
-            word.cells = linked
-            for cell in linked:
-                cell.word.down = word
-            word.cells[0].number = word.number
-            # Add the word to the lists
+        self.ordinals = {}
+        # Load the words from the cached layout
+        self.layout = layout = _layout.cache.get(puzzle)
+        directions = (ACROSS,) * layout.across + (DOWN,) * (len(layout) - layout.across)
+        for direction, number, clue, start, end in zip(directions, layout.numbers, layout.clues, layout.offsets, layout.offsets[1:]):
+            word = WordModel(direction, number, puzzle.clues[clue])
+            word.cells = cells.select(range(layout.cells[start], layout.cells[end-1] + 1, 1 if direction == ACROSS else layout.width))
             self.words.append(word)
-            self.down.append(word)
+        # Across words come first like the clue lists
+        self.across = self.words[:layout.across]
+        self.down = self.words[layout.across:]
+        self.ordinals = {word: i for words in (self.across, self.down) for i, word in enumerate(words)}
+        # Link the cells to their words
+        cells.link(self.words, self.layout)
 
     def __iter__(self):
         """Iterate through the words in the access."""
-        return self.words
+        return iter(self.words)
 
     def __len__(self):
         """Get the number of words in the access."""
@@ -170,15 +493,36 @@ class WordsAccess:
 
     def __getitem__(self, key):
         """Conveniently get the across or down word list."""
-        return {ACROSS: self.across, DOWN: self.down}[key]
+        # Directions are named after the attributes
+        return getattr(self, key)
+
+    def index(self, word: WordModel) -> int:
+        """Get the position of a word in its direction's list."""
+        return self.ordinals[word]
+
+
+def rebuild(data: bytes, cells, letters: list, owners: array.array, stamps: array.array):
+    """Rebuild a puzzle model from its network form."""
+    # The puzzle was already checked when it was first loaded
+    model = PuzzleModel(puz.load(data, strict=False), cells, data)
+    model.load(letters, owners)
+    # Every write is owned by its writer
+    model.registers = _history.Registers(len(model.cells), stamps, owners)
+    return model
 
 
 class PuzzleModel:
     """Basic container class for a single old cell."""
 
-    def __init__(self, puzzle: puz.Puzzle):
-        """Initialize a crossword cell container with a puzzle."""
+    def __init__(self, puzzle: puz.Puzzle, cells=CellsAccess, data: bytes=None):
+        """Initialize a crossword cell container with a puzzle.
+
+        The cells access class can be swapped for ArrayCellsAccess to
+        keep the board in parallel arrays. The puzzle data is kept for
+        the network form and is packed from the puzzle if not given.
+        """
         # Basic puzzle data
+        self.data = data or puzzle.tobytes()
         self.title = puzzle.title
         self.author = puzzle.author
         self.copyright = puzzle.copyright
@@ -188,16 +532,154 @@ class PuzzleModel:
         self.height = puzzle.height
         self.version = puzzle.version
         # Cells and words
-        self.cells = CellsAccess(puzzle)
+        self.cells = cells(puzzle)
         self.words = WordsAccess(puzzle, self.cells)
+        self.navigation = self.words.layout.navigation
+        # Locked solutions can only be checked by checksum
+        self.locked = puzzle.is_solution_locked()
+        self.checksum = ChecksumTracker(puzzle) if self.locked else None
+        # Completion counters and event bindings
+        self.solution = puzzle.solution
+        self.total = self.words.layout.grid.count(0)
+        self.filled = 0
+        self.correct = 0
+        self.completed = False
+        self.bindings = {}
+        # Copy-on-write rows of the fill for snapshots and a change journal
+        self.board = self.cells.board
+        self.journal = _history.Journal(len(self.cells), self.width)
+        self.registers = _history.Registers(len(self.cells))
+
+    def __reduce__(self):
+        """Reduce the model to its puzzle data and fill for pickling.
+
+        The receiver rebuilds the cells, words, and links locally from
+        the puzzle data rather than unpickling them.
+        """
+        return rebuild, (self.data, type(self.cells)) + self.cells.fill() + (self.registers.stamps,)
+
+    def bind(self, event: str, function):
+        """Bind a function to a model event."""
+        self.bindings[event] = function
+
+    def emit(self, event: str, data: object):
+        """Call the function bound to a model event."""
+        function = self.bindings.get(event)
+        if function:
+            function(data)
+
+    def edit(self, x: int, y: int, letters: str, owner=None) -> int:
+        """Write letters typed locally and get their timestamp.
+
+        Players edit their own board right away and merge the edits of
+        others, which converges through the last-writer-wins registers.
+        """
+        stamp = self.registers.tick()
+        self.registers.merge(to_index(x, y, self.width), stamp, owner)
+        self.write(x, y, letters, owner)
+        return stamp
+
+    def merge(self, x: int, y: int, letters: str, owner, stamp: int) -> bool:
+        """Write letters from another replica if they win the cell."""
+        # Remote writes outside the board or onto black squares are rejected
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+        index = to_index(x, y, self.width)
+        if self.words.layout.grid[index] != 0:
+            return False
+        if not self.registers.merge(index, stamp, owner):
+            return False
+        self.write(x, y, letters, owner)
+        return True
+
+    def write(self, x: int, y: int, letters: str, owner=None):
+        """Change the letters and owner of a cell.
+
+        Letters should only be changed through here, which keeps the
+        filled and correct counts of the board and its words, emits
+        completion events, and records the change in the journal.
+        """
+        index = to_index(x, y, self.width)
+        previous = self.cells.write(index, letters, owner)
+        self.journal.letter(index, letters, owner)
+        if self.checksum:
+            self.checksum.update(index, letters)
+        # Only the difference to the old letters is counted
+        filled = bool(letters) - bool(previous)
+        correct = 0
+        # Locked puzzles cannot be checked cell by cell, only by checksum
+        if not self.locked:
+            solution = self.solution[index]
+            correct = (letters[:1] == solution) - (previous[:1] == solution)
+        self.filled += filled
+        self.correct += correct
+        layout = self.words.layout
+        for i in (layout.across_of[index], layout.down_of[index]):
+            if i >= 0 and (filled or correct):
+                word = self.words.words[i]
+                word.filled += filled
+                word.correct += correct
+                if correct > 0 and word.correct == len(word.cells):
+                    self.emit(WORD_COMPLETED, word)
+        # Board events only fire when the state changes
+        if filled > 0 and self.filled == self.total:
+            self.emit(BOARD_FILLED, None)
+        completed = self.solved()
+        if completed != self.completed:
+            self.completed = completed
+            if completed:
+                self.emit(BOARD_COMPLETED, None)
+
+    def load(self, letters: list, owners: array.array):
+        """Fill the board at once and count its letters in one pass.
+
+        Unlike write, nothing is journaled and no events are emitted,
+        and the loaded fill becomes the journal's starting state.
+        """
+        self.cells.load(letters, owners)
+        self.journal.origin = self.board.snapshot()
+        # Flag the filled and correct cells, then count them per word
+        filled = bytes([bool(letter) for letter in letters])
+        if self.locked:
+            correct = bytes(len(filled))
+        else:
+            correct = bytes([letter[:1] == solution for letter, solution in zip(letters, self.solution)])
+        self.filled = sum(filled)
+        self.correct = sum(correct)
+        for word, cells in zip(self.words.words, self.words.layout.slices):
+            word.filled = filled[cells].count(1)
+            word.correct = correct[cells].count(1)
+        if self.checksum:
+            for index, letter in enumerate(letters):
+                if letter:
+                    self.checksum.update(index, letter)
+        self.completed = self.solved()
+
+    def snapshot(self) -> _history.Snapshot:
+        """Take a snapshot of the letters and owners of the board."""
+        return self.board.snapshot()
+
+    def restore(self, snapshot: _history.Snapshot):
+        """Write back the cells that differ from a snapshot."""
+        for index in self.board.diff(snapshot):
+            letters, owner = snapshot.read(index)
+            self.write(*to_position(index, self.width), letters, owner or None)
+
+    def solved(self) -> bool:
+        """Check whether the board matches the solution."""
+        if self.checksum:
+            return self.filled == self.total and self.checksum.solved()
+        return self.correct == self.total
 
 
 class PlayerModel:
     """Basic player profile model."""
 
+    __slots__ = ("custom", "id", "direction", "x", "y")
+
     def __init__(self, name: str, color: str):
         """Initialize a player profile model."""
-        self.custom = {}
+        self.custom = {NAME: name, COLOR: color}
         # Defined by server
         self.id = 0
         # Already set
@@ -219,3 +701,48 @@ class PlayerModel:
 
     def __setitem__(self, key, value):
         self.custom[key] = value
+
+
+class PlayersAccess:
+    """Registry of player models by their id.
+
+    Player colors are cached by id when a player is added so drawing a
+    cell does not have to look up its owner's profile.
+    """
+
+    def __init__(self, players=()):
+        """Initialize the registry with a sequence of players."""
+        self.players = {}
+        self.colors = {}
+        for player in players:
+            self.add(player)
+
+    def __iter__(self):
+        """Iterate through the players in the registry."""
+        return iter(self.players.values())
+
+    def __len__(self):
+        """Get the number of players in the registry."""
+        return len(self.players)
+
+    def __contains__(self, pid: int):
+        """Check if a player id is in the registry."""
+        return pid in self.players
+
+    def get(self, pid: int, default=None) -> PlayerModel:
+        """Get a player by their id."""
+        return self.players.get(pid, default)
+
+    def color(self, pid: int, default=None) -> str:
+        """Get the color of a player by their id."""
+        return self.colors.get(pid, default)
+
+    def add(self, player: PlayerModel):
+        """Add or replace a player in the registry."""
+        self.players[player.id] = player
+        self.colors[player.id] = player[COLOR]
+
+    def remove(self, pid: int):
+        """Remove a player from the registry by their id."""
+        self.players.pop(pid, None)
+        self.colors.pop(pid, None)
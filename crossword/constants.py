@@ -13,6 +13,7 @@ import logging
 ROOT = _os.path.abspath(_os.path.dirname(__file__))
 SETTINGS = "settings.xml"
 PLAYERS = "players.json"
+LAYOUTS = "layouts"
 COPY = "default"
 
 # Logging
@@ -32,6 +33,9 @@ NUMBER_PAD_TOP = 6
 DEFAULT_PUZZLE_HEIGHT = 15
 DEFAULT_PUZZLE_WIDTH = 15
 
+# Event loop frame interval in milliseconds
+FRAME = 16
+
 # Control constants
 ALL_ARROWS = ("Left", "Right", "Up", "Down")
 ACROSS_ARROWS = ("Left", "Right")
@@ -42,6 +46,7 @@ POSITIVE_ARROWS = ("Right", "Down")
 # Model constants
 LETTER = "-"
 EMPTY = "."
+BLANK = "-"
 DOWN = "down"
 ACROSS = "across"
 
@@ -55,14 +60,22 @@ CLIENT_EXITED = "client exited"
 CLIENT_KICKED = "server kicked"
 SERVER_STOPPED = "server stopped"
 SERVER_UPDATED = "server updated"
+SERVER_TICKED = "server ticked"
 PUZZLE_REQUESTED = "puzzle requested"
 PUZZLE_SUBMITTED = "puzzle submitted"
 PUZZLE_PASSED = "puzzle passed"
 PUZZLE_UPDATED = "puzzle updated"
+PUZZLE_PARSED = "puzzle parsed"
+
+# Model events
+WORD_COMPLETED = "word completed"
+BOARD_FILLED = "board filled"
+BOARD_COMPLETED = "board completed"
 
 POSITION = "position"
 DIRECTION = "direction"
 CLIENTS = "clients"
+COMPRESSION = "compression"
 ID = "id"
 
 NAME = "name"
@@ -0,0 +1,269 @@
+"""Crossword wire codec.
+
+Messages start with a codec version and an event id. The events sent
+the most have their payloads packed into fixed struct layouts, with
+strings prefixed by their length. Anything else, including payloads a
+layout cannot hold, is pickled whole under the event id zero. Large
+payloads may be compressed with zlib, which is flagged in the high bit
+of the event id.
+"""
+
+# Import
+import zlib
+import struct
+import pickle
+from crossword.application import model
+from crossword.constants import *
+
+# Message header: codec version, event id
+VERSION = 2
+HEADER = struct.Struct(">BB")
+PICKLED = 0
+COMPRESSED = 0x80
+
+# Client update flags for the player id and each field present
+PLAYER = 0x80
+FIELDS = ((0x01, "HH"), (0x02, "B"), (0x04, "HHIB"))
+DIRECTIONS = (ACROSS, DOWN)
+
+# Server update kinds
+UPDATES = (ID, CLIENTS, COMPRESSION)
+
+# Fixed layouts
+_id = struct.Struct(">Q")
+_position = struct.Struct(">HH")
+_letter = struct.Struct(">HHI")
+_count = struct.Struct(">H")
+_player = struct.Struct(">QHHB")
+
+# Client update layouts by flags, each ending before the letters if any
+_updates = {}
+for flags in range(PLAYER * 2):
+    if flags & ~PLAYER < 8:
+        _updates[flags] = struct.Struct(">B" + "Q" * bool(flags & PLAYER) +
+                                        "".join(layout for flag, layout in FIELDS if flags & flag))
+
+
+class Unpackable(Exception):
+    """Raised for data that has no struct layout."""
+
+
+# Strings
+def _pack_string(string: str) -> bytes:
+    """Pack a string with its length."""
+    data = string.encode("utf-8")
+    if len(data) > 255:
+        raise Unpackable("string too long")
+    return bytes((len(data),)) + data
+
+
+def _unpack_string(data: bytes, offset: int) -> tuple:
+    """Unpack a string and get the offset after it."""
+    end = offset + 1 + data[offset]
+    return str(data[offset+1:end], "utf-8"), end
+
+
+# Payloads
+def pack_none(data: None) -> bytes:
+    """Pack an empty payload."""
+    if data is not None:
+        raise Unpackable("payload is not empty")
+    return b""
+
+
+def unpack_none(data: bytes, offset: int) -> None:
+    """Unpack an empty payload."""
+    return None
+
+
+def pack_bytes(data: bytes) -> bytes:
+    """Pack raw bytes."""
+    return bytes(data)
+
+
+def unpack_bytes(data: bytes, offset: int) -> bytes:
+    """Unpack raw bytes."""
+    return bytes(data[offset:])
+
+
+def pack_update(data: object) -> bytes:
+    """Pack a client update, optionally with the id of its player."""
+    values = [0]
+    if type(data) is tuple:
+        pid, data = data
+        values[0] = PLAYER
+        values.append(pid)
+    position = data.get(POSITION)
+    direction = data.get(DIRECTION)
+    letter = data.get(LETTER)
+    if (position is not None) + (direction is not None) + (letter is not None) != len(data):
+        raise Unpackable("unknown client update key")
+    # One struct for the fields present, with the letters after it
+    if position is not None:
+        values[0] |= 0x01
+        values += position
+    if direction is not None:
+        values[0] |= 0x02
+        values.append(DIRECTIONS.index(direction))
+    if letter is None:
+        return _updates[values[0]].pack(*values)
+    x, y, letters, stamp = letter
+    letters = letters.encode("utf-8")
+    values[0] |= 0x04
+    values += x, y, stamp, len(letters)
+    return _updates[values[0]].pack(*values) + letters
+
+
+def unpack_update(data: bytes, offset: int) -> object:
+    """Unpack a client update."""
+    flags = data[offset]
+    layout = _updates.get(flags)
+    if layout is None:
+        raise ValueError("unknown client update flags %i" % flags)
+    values = layout.unpack_from(data, offset)
+    i = 1
+    if flags & PLAYER:
+        pid = values[1]
+        i = 2
+    update = {}
+    if flags & 0x01:
+        update[POSITION] = values[i:i+2]
+        i += 2
+    if flags & 0x02:
+        update[DIRECTION] = DIRECTIONS[values[i]]
+        i += 1
+    if flags & 0x04:
+        x, y, stamp, length = values[i:i+4]
+        offset += layout.size
+        update[LETTER] = x, y, str(data[offset:offset+length], "utf-8"), stamp
+    return (pid, update) if flags & PLAYER else update
+
+
+def pack_player(player: model.PlayerModel) -> bytes:
+    """Pack a player profile and position."""
+    if set(player.custom) != {NAME, COLOR}:
+        raise Unpackable("player has custom fields")
+    direction = DIRECTIONS.index(player.direction)
+    return _player.pack(player.id, player.x, player.y, direction) + \
+        _pack_string(player[NAME]) + _pack_string(player[COLOR])
+
+
+def unpack_player(data: bytes, offset: int) -> tuple:
+    """Unpack a player and get the offset after it."""
+    pid, x, y, direction = _player.unpack_from(data, offset)
+    name, offset = _unpack_string(data, offset + _player.size)
+    color, offset = _unpack_string(data, offset)
+    player = model.PlayerModel(name, color)
+    player.id, player.x, player.y, player.direction = pid, x, y, DIRECTIONS[direction]
+    return player, offset
+
+
+def pack_server(data: dict) -> bytes:
+    """Pack a server update of either an id or a client list."""
+    if len(data) != 1:
+        raise Unpackable("server update has several keys")
+    key, value = next(iter(data.items()))
+    if key == ID:
+        return bytes((UPDATES.index(ID),)) + _id.pack(value)
+    if key == COMPRESSION:
+        return bytes((UPDATES.index(COMPRESSION), bool(value)))
+    players = b"".join(map(pack_player, value))
+    return bytes((UPDATES.index(key),)) + _count.pack(len(value)) + players
+
+
+def unpack_server(data: bytes, offset: int) -> dict:
+    """Unpack a server update."""
+    key = UPDATES[data[offset]]
+    if key == ID:
+        return {ID: _id.unpack_from(data, offset + 1)[0]}
+    if key == COMPRESSION:
+        return {COMPRESSION: bool(data[offset + 1])}
+    players = []
+    count = _count.unpack_from(data, offset + 1)[0]
+    offset += 1 + _count.size
+    for i in range(count):
+        player, offset = unpack_player(data, offset)
+        players.append(player)
+    return {CLIENTS: players}
+
+
+def pack_joined(data: dict) -> bytes:
+    """Pack the profile of a joining client and whether it offers compression."""
+    offer = data.get(COMPRESSION)
+    if len(data) != 2 + (COMPRESSION in data) or NAME not in data or COLOR not in data:
+        raise Unpackable("join has custom fields")
+    name = data[NAME].encode("utf-8")
+    color = data[COLOR].encode("utf-8")
+    return b"".join((bytes((len(name),)), name, bytes((len(color),)), color, b"\1" if offer else b"\0"))
+
+
+def unpack_joined(data: bytes, offset: int) -> dict:
+    """Unpack the profile of a joining client."""
+    name, offset = _unpack_string(data, offset)
+    color, offset = _unpack_string(data, offset)
+    if data[offset]:
+        return {NAME: name, COLOR: color, COMPRESSION: True}
+    return {NAME: name, COLOR: color}
+
+
+# Events by id, starting from one
+EVENTS = (
+    (CLIENT_UPDATED, pack_update, unpack_update),
+    (SERVER_UPDATED, pack_server, unpack_server),
+    (CLIENT_JOINED, pack_joined, unpack_joined),
+    (CLIENT_EXITED, pack_none, unpack_none),
+    (PUZZLE_REQUESTED, pack_none, unpack_none),
+    (PUZZLE_PASSED, pack_none, unpack_none),
+    (PUZZLE_SUBMITTED, pack_bytes, unpack_bytes))
+IDS = {event: i for i, (event, pack, unpack) in enumerate(EVENTS, 1)}
+HEADERS = [HEADER.pack(VERSION, i) for i in range(len(EVENTS) + 1)]
+
+
+def encode(event: str, data: object) -> bytes:
+    """Encode an event and its data as a message."""
+    i = IDS.get(event)
+    if i is not None:
+        try:
+            return HEADERS[i] + EVENTS[i-1][1](data)
+        except (Unpackable, struct.error, ValueError, TypeError, AttributeError):
+            # Fall back to pickling the message
+            pass
+    return HEADERS[PICKLED] + pickle.dumps((event, data))
+
+
+def compress(message: bytes, threshold: int, level: int=6) -> bytes:
+    """Compress the payload of a message if it is at least a threshold size."""
+    if len(message) - HEADER.size < threshold or message[1] & COMPRESSED:
+        return message
+    payload = zlib.compress(memoryview(message)[HEADER.size:], level)
+    # Keep payloads that do not shrink as they are
+    if len(payload) >= len(message) - HEADER.size:
+        return message
+    return HEADER.pack(message[0], message[1] | COMPRESSED) + payload
+
+
+def inflate(payload: memoryview, maximum: int=None) -> bytes:
+    """Decompress a payload, refusing to grow it past a maximum size."""
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(payload, maximum or 0)
+    if decompressor.unconsumed_tail:
+        raise ValueError("compressed payload is over the limit of %i" % maximum)
+    return data
+
+
+def decode(message: bytes, maximum: int=None) -> tuple:
+    """Decode a message into its event and data."""
+    version, i = message[0], message[1]
+    if version != VERSION:
+        raise ValueError("unsupported codec version %i" % version)
+    # Payloads are unpacked in place from their offset in the message
+    offset = HEADER.size
+    if i & COMPRESSED:
+        i &= ~COMPRESSED
+        message, offset = inflate(memoryview(message)[offset:], maximum), 0
+    if i > len(EVENTS):
+        raise ValueError("unknown event id %i" % i)
+    if i == PICKLED:
+        return pickle.loads(memoryview(message)[offset:])
+    event, pack, unpack = EVENTS[i-1]
+    return event, unpack(message, offset)
@@ -1,22 +1,33 @@
 import os
+import time
+import threading
 from . import wrapper
-from crossword import puz
 import crossword.utility.metrics
 from crossword.application import model
+from crossword.system import sandbox
+from crossword.settings import settings
 from crossword.constants import *
 
 
-class CrosswordHandler(wrapper.SocketHandler):
+class CrosswordPlayer:
+    """Player state of a crossword handler in either server engine."""
 
-    def __init__(self, sock, address, server):
-        super().__init__(sock, address, server)
+    def __init__(self, *args):
+        super().__init__(*args)
         self.model = model.PlayerModel(name="", color="")
         self.model.id = id(self)
 
 
-class CrosswordServer(wrapper.SocketServer):
+class CrosswordHandler(CrosswordPlayer, wrapper.SocketHandler):
+    pass
+
+
+class AsyncCrosswordHandler(CrosswordPlayer, wrapper.AsyncSocketHandler):
+    pass
 
-    handler = CrosswordHandler
+
+class CrosswordEvents:
+    """Crossword server event handlers shared by both server engines."""
 
     def __init__(self, address):
         """Initialize the crossword handler."""
@@ -24,6 +35,20 @@ class CrosswordServer(wrapper.SocketServer):
         super().__init__(address)
         self.model = None
         self.metrics = None
+        self.players = model.PlayersAccess()
+        # Only one submitted puzzle is parsed at a time
+        self.parsing = None
+        # Cursor updates waiting for the next tick by player id
+        self.tick = settings.network.server.tick / 1000
+        self.cursors = {}
+        # Limit the messages received and the outbound queue of each client
+        self.maximum = settings.network.server.maximum * 1024
+        limits = settings.network.outbound
+        self.low, self.high, self.limit = limits.low * 1024, limits.high * 1024, limits.limit * 1024
+        self.timeout = limits.timeout
+        # Compress large messages for clients that offer to
+        compression = settings.network.compression
+        self.compression, self.threshold, self.level = compression.enabled, compression.threshold, compression.level
         # Create a server puzzle directory
         if not os.path.isdir("puzzles"):
             os.makedirs("puzzles")
@@ -33,6 +58,8 @@ class CrosswordServer(wrapper.SocketServer):
         self.bind(CLIENT_UPDATED, self.on_client_updated)
         self.bind(PUZZLE_PASSED, self.on_puzzle_passed)
         self.bind(PUZZLE_SUBMITTED, self.on_puzzle_submitted)
+        self.bind(PUZZLE_PARSED, self.on_puzzle_parsed)
+        self.bind(SERVER_TICKED, self.on_server_ticked)
         logging.info("%s: bound custom events", self)
 
     def __repr__(self):
@@ -41,12 +68,16 @@ class CrosswordServer(wrapper.SocketServer):
 
     def on_client_joined(self, data: dict, handler: CrosswordHandler):
         """Called when a client joins the server."""
+        # Accept compression if the client offers it
+        handler.compression = bool(data.pop(COMPRESSION, False) and self.compression)
         # Update the handler data
         handler.model.update(**data)
+        self.players.add(handler.model)
         logging.info("%s: client named '%s' joined as %s", self, handler.model["name"], handler.model.id)
         # Update the rest of the clients
         self.update_clients()
         handler.emit(SERVER_UPDATED, {ID: handler.model.id})
+        handler.emit(SERVER_UPDATED, {COMPRESSION: handler.compression})
         self.emit(CLIENT_JOINED, data)
         # Check if there is a model
         if not self.model:
@@ -56,6 +87,9 @@ class CrosswordServer(wrapper.SocketServer):
 
     def on_client_exited(self, data: None, handler: CrosswordHandler):
         """Called when a client leaves the server."""
+        self.players.remove(handler.model.id)
+        self.cursors.pop(handler.model.id, None)
+        logging.info("%s: client %s left with outbound %s", self, handler.model.id, handler.outbound.report())
         # Check if the number of handlers is 0
         if len(self.handlers) == 0:
             self.model = None
@@ -71,57 +105,147 @@ class CrosswordServer(wrapper.SocketServer):
 
     def on_puzzle_submitted(self, data: bytes, handler: CrosswordHandler):
         """Called when the selected user submits a puzzle."""
+        if self.parsing or self.model:
+            logging.warning("%s: refused puzzle from %s while %s", self, handler.model.id,
+                            "another is parsed" if self.parsing else "one is loaded")
+            return
+        self.parsing = handler
+        # Parse the untrusted puzzle without blocking the event loop
+        parser = threading.Thread(target=self.parse, args=(data, handler), daemon=True)
+        parser.start()
+
+    def parse(self, data: bytes, handler: CrosswordHandler):
+        """Parse a submitted puzzle in the sandbox and queue the result."""
+        limits = settings.network.sandbox
+        result = sandbox.parse(data, limits.size, limits.time, limits.memory * 1024**2)
+        self.queue.put((PUZZLE_PARSED, (data, result), handler))
+
+    def on_puzzle_parsed(self, data: tuple, handler: CrosswordHandler):
+        """Called when a submitted puzzle has been parsed."""
+        data, result = data
+        self.parsing = None
+        if isinstance(result, sandbox.Rejection):
+            # Accept failure and ask again
+            logging.warning("%s: refused puzzle from %s, %s", self, handler.model.id, result)
+            handler.emit(PUZZLE_REQUESTED, None)
+            return
         # Write the received puzzle to a file
         path = os.path.join("puzzles", str(hash(data)) + ".puz")
         with open(path, "wb") as file:
             file.write(data)
-        # Try to read the puzzle
-        try:
-            self.model = model.PuzzleModel(puz.read(path))
-        except puz.PuzzleFormatError:
-            # Accept failure and ask again
-            handler.emit(PUZZLE_REQUESTED, None)
-        else:
-            # Otherwise, record metrics and update the other players
-            self.metrics = crossword.utility.metrics.PuzzleMetrics(self.model)
-            self.emit(PUZZLE_UPDATED, self.model)
+        # Record metrics and update the other players
+        self.model = model.PuzzleModel(result, model.ArrayCellsAccess, data)
+        self.model.bind(BOARD_FILLED, self.on_board_filled)
+        self.model.bind(BOARD_COMPLETED, self.on_board_completed)
+        self.metrics = crossword.utility.metrics.PuzzleMetrics(self.model)
+        self.metrics.time_start = time.time()
+        self.emit(PUZZLE_UPDATED, self.model)
+
+    # Puzzle model methods
+    def on_board_filled(self, data: None):
+        """Called when the last blank cell of the board is filled."""
+        self.metrics.time_fill = time.time()
+        logging.info("%s: board filled", self)
+
+    def on_board_completed(self, data: None):
+        """Called when the board matches the solution."""
+        self.metrics.time_finish = time.time()
+        self.metrics.time_total = self.metrics.time_finish - self.metrics.time_start
+        logging.info("%s: board completed in %.1f seconds", self, self.metrics.time_total)
 
     # User echo methods
     def on_client_updated(self, data: tuple, handler: CrosswordHandler):
         """Called when a client has updated themself."""
+        if not self.valid(data):
+            logging.warning("%s: dropped invalid update from %s", self, handler.model.id)
+            return
+        cursor = {}
         for key in data:
             # Move the player
             if key == POSITION:
-                handler.model.x, handler.model.y = data[POSITION]
+                handler.model.x, handler.model.y = cursor[POSITION] = data[POSITION]
+                if self.model:
+                    index = model.to_index(*data[POSITION], self.model.width)
+                    self.model.journal.position(handler.model.id, index)
             # Change the players direction
             elif key == DIRECTION:
-                handler.model.direction = data[DIRECTION]
+                handler.model.direction = cursor[DIRECTION] = data[DIRECTION]
+                if self.model:
+                    self.model.journal.direction(handler.model.id, data[DIRECTION])
             # Check if the player changed their cell letter
             elif key == LETTER:  # This is not symbolically correct but works fine.
-                x, y, letters = data[LETTER]
-                self.model.cells[x, y].letters = letters
-                self.model.cells[x, y].owner = handler.model.id
+                x, y, letters, stamp = data[LETTER]
+                if self.model:
+                    self.model.merge(x, y, letters, handler.model.id, stamp)
             else:
                 print("Warning: received invalid key for player update '%s'." % key)
-        # Update the rest of the handlers
-        others = self.handlers[:]
-        others.remove(handler)
-        self.emit(CLIENT_UPDATED, (handler.model.id, data), *others)
+        # Update the rest of the handlers with letters right away
+        rest = {key: value for key, value in data.items() if key not in cursor}
+        if rest:
+            self.emit(CLIENT_UPDATED, (handler.model.id, rest), exclude=handler)
+        if not cursor:
+            return
+        # Merge cursor moves until the next tick
+        if not self.tick:
+            self.emit_cursor(handler.model.id, handler, cursor)
+            return
+        if not self.cursors:
+            self.later(self.tick, SERVER_TICKED)
+        self.cursors.setdefault(handler.model.id, (handler, {}))[1].update(cursor)
+
+    def valid(self, data: dict) -> bool:
+        """Check that the cursor in a client update is on the board."""
+        if POSITION in data:
+            position = data[POSITION]
+            if not (isinstance(position, (tuple, list)) and len(position) == 2 and all(type(i) is int for i in position)):
+                return False
+            x, y = position
+            if x < 0 or y < 0 or self.model and (x >= self.model.width or y >= self.model.height):
+                return False
+        if DIRECTION in data and data[DIRECTION] not in (ACROSS, DOWN):
+            return False
+        return True
+
+    def on_server_ticked(self, data: None, handler: None):
+        """Called when the merged cursor moves are due."""
+        cursors, self.cursors = self.cursors, {}
+        for pid, (sender, cursor) in cursors.items():
+            self.emit_cursor(pid, sender, cursor)
+
+    def emit_cursor(self, pid: int, sender: CrosswordHandler, cursor: dict):
+        """Send the cursor of a player to the rest of the handlers."""
+        # Later cursor moves supersede this one for congested handlers
+        self.emit(CLIENT_UPDATED, (pid, cursor), exclude=sender, key=(pid, frozenset(cursor)))
 
     # Special case methods
     def update_clients(self):
         """Updates the clients to the current client list."""
-        models = [handler.model for handler in self.handlers]
-        for handler in self.handlers:
-            # Remove the handler to avoid confusion
-            copy = models[:]
-            copy.remove(handler.model)
-            handler.emit(SERVER_UPDATED, {CLIENTS: copy})
+        # Clients pick themselves out of the list by id
+        self.emit(SERVER_UPDATED, {CLIENTS: list(self.players)})
+
+
+class CrosswordServer(CrosswordEvents, wrapper.SocketServer):
+    """Crossword server with a thread per client."""
+
+    handler = CrosswordHandler
+
+
+class AsyncCrosswordServer(CrosswordEvents, wrapper.AsyncSocketServer):
+    """Crossword server with every client on one event loop."""
+
+    handler = AsyncCrosswordHandler
+
+
+# Server engines by their setting
+ENGINES = {"threads": CrosswordServer, "asyncio": AsyncCrosswordServer}
 
 
 class CrosswordConnection(wrapper.SocketConnection):
 
     def __init__(self, address):
         super().__init__(address)
+        self.maximum = settings.network.client.maximum * 1024
+        compression = settings.network.compression
+        self.threshold, self.level = compression.threshold, compression.level
 
 
@@ -1,35 +1,216 @@
+import time
+import heapq
 import socket
 import struct
 import queue
+import asyncio
+import itertools
 import threading
-import pickle
+import collections
+from . import codec
 from crossword.constants import *
 
 
-# Socket utility
-def send(sock: socket.socket, message: bytes):
-    """Pack the message length and content for sending larger messages."""
-    message = struct.pack('>I', len(message)) + message
-    sock.sendall(message)
+# Frame length prefix, default largest frame, and most frames sent at once
+LENGTH = struct.Struct('>I')
+MAXIMUM = 16 * 1024**2
+BATCH = 64
 
 
-def recv(sock: socket.socket) -> bytes:
-    """Read message length and receive the corresponding amount of data."""
-    size = _recv(sock, 4)
-    size = struct.unpack('>I', size)[0]
-    return _recv(sock, size)
+# Socket utility
+def frame(message: bytes) -> bytes:
+    """Prefix a message with its length."""
+    return LENGTH.pack(len(message)) + message
 
 
-def _recv(sock: socket.socket, size: int) -> bytes:
-    """Secondary function to receive a specified amount of data."""
-    message = b''
-    while len(message) < size:
-        packet = sock.recv(size - len(message))
-        if not packet:
-            sock.close()
+def send(sock: socket.socket, message: bytes):
+    """Pack the message length and content for sending larger messages."""
+    sendmsg(sock, [LENGTH.pack(len(message)), message])
+
+
+def gather(messages: list) -> list:
+    """Get the length prefix and content buffers of several messages."""
+    buffers = []
+    for message in messages:
+        buffers.append(LENGTH.pack(len(message)))
+        buffers.append(message)
+    return buffers
+
+
+def sendmsg(sock: socket.socket, buffers: list) -> int:
+    """Send buffers in order without joining them and get the calls made."""
+    if not hasattr(sock, "sendmsg"):
+        # Platforms without scatter-gather sends copy the buffers together
+        sock.sendall(b"".join(buffers))
+        return 1
+    calls = 0
+    while buffers:
+        sent = sock.sendmsg(buffers)
+        calls += 1
+        # Skip the buffers sent and cut into the first one left
+        i = 0
+        while i < len(buffers) and sent >= len(buffers[i]):
+            sent -= len(buffers[i])
+            i += 1
+        buffers = buffers[i:]
+        if sent:
+            buffers[0] = memoryview(buffers[0])[sent:]
+    return calls
+
+
+class FrameReader:
+    """Reader of length-prefixed frames from a socket.
+
+    Data is received straight into a reusable buffer, and every frame
+    completed by a read is handed out as a view of its payload, so a
+    message is never copied or joined from pieces. The views are only
+    valid until the next read. The buffer grows to fit the largest
+    frame seen, and frames over the maximum size are refused.
+    """
+
+    def __init__(self, sock: socket.socket, maximum: int=MAXIMUM, size: int=256 * 1024):
+        """Initialize a frame reader with an empty buffer."""
+        self.sock = sock
+        self.maximum = maximum
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        # Unread data lies between the start and end
+        self.start = 0
+        self.end = 0
+        self.payloads = []
+
+    def length(self) -> int:
+        """Get the length of the frame at the start of the buffer."""
+        size = LENGTH.unpack_from(self.buffer, self.start)[0]
+        if size > self.maximum:
+            raise ValueError("frame of %i bytes is over the limit of %i" % (size, self.maximum))
+        return LENGTH.size + size
+
+    def read(self) -> list:
+        """Receive once and get the payloads of the frames completed."""
+        for payload in self.payloads:
+            payload.release()
+        # Size of the frame left over, or just its length prefix
+        needed = self.length() if self.end - self.start >= LENGTH.size else LENGTH.size
+        # Move the frame left over to the front only when the rest of the buffer is short
+        if self.start and (self.start + needed > len(self.buffer) or len(self.buffer) - self.end < len(self.buffer) // 4):
+            self.buffer[:self.end - self.start] = self.view[self.start:self.end]
+            self.end -= self.start
+            self.start = 0
+        # Make room for the whole of a frame larger than the buffer
+        if self.start + needed > len(self.buffer):
+            buffer = bytearray(needed)
+            buffer[:self.end] = self.view[:self.end]
+            self.view.release()
+            self.buffer, self.view = buffer, memoryview(buffer)
+        count = self.sock.recv_into(self.view[self.end:])
+        if not count:
+            self.sock.close()
             raise OSError("Nothing else to read from socket")
-        message += packet
-    return message
+        self.end += count
+        # Cut out every complete frame
+        self.payloads = []
+        while self.end - self.start >= LENGTH.size:
+            size = self.length()
+            if self.end - self.start < size:
+                break
+            self.payloads.append(self.view[self.start + LENGTH.size:self.start + size])
+            self.start += size
+        if self.start == self.end:
+            self.start = self.end = 0
+        return self.payloads
+
+
+class Outbound:
+    """Bounded queue of framed messages waiting to be sent to a client.
+
+    The queue is measured in bytes against a low and a high watermark.
+    Once it rises above the high watermark it is congested until it
+    drains back to the low one, and while it is congested a message
+    with a key supersedes the queued message with the same key, which
+    is dropped unsent. A client whose queue passes the hard limit, or
+    stays congested for longer than the timeout, cannot keep up.
+    Messages are queued without their length prefix, which is only
+    added as they are sent.
+    """
+
+    def __init__(self, low: int, high: int, limit: int, timeout: float):
+        """Initialize an empty outbound queue with its limits."""
+        self.low = low
+        self.high = high
+        self.limit = limit
+        self.timeout = timeout
+        # Entries are message and key pairs, with dropped messages set to None
+        self.entries = collections.deque()
+        self.keys = {}
+        self.depth = 0
+        self.congested = None
+        # Counters
+        self.peak = 0
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.writes = 0
+
+    def __len__(self):
+        """Get the number of entries in the queue."""
+        return len(self.entries)
+
+    def put(self, message: bytes, key: object=None) -> bool:
+        """Queue a message and check whether the client is keeping up."""
+        entry = [message, key]
+        if key is not None:
+            previous = self.keys.get(key)
+            if self.congested is not None and previous is not None and previous[0] is not None:
+                self.depth -= len(previous[0])
+                previous[0] = None
+                self.dropped += 1
+            self.keys[key] = entry
+        self.entries.append(entry)
+        self.depth += len(message)
+        self.queued += 1
+        self.peak = max(self.peak, self.depth)
+        if self.congested is None and self.depth > self.high:
+            self.congested = time.monotonic()
+        if self.depth > self.limit:
+            return False
+        return self.congested is None or time.monotonic() - self.congested <= self.timeout
+
+    def get(self) -> bytes:
+        """Take the next message to send, or None if there is none."""
+        while self.entries:
+            entry = self.entries.popleft()
+            message, key = entry
+            if key is not None and self.keys.get(key) is entry:
+                del self.keys[key]
+            if message is None:
+                continue
+            self.depth -= len(message)
+            self.sent += 1
+            if self.congested is not None and self.depth <= self.low:
+                self.congested = None
+            return message
+        return None
+
+    def take(self, count: int) -> list:
+        """Take up to a number of messages to send at once."""
+        messages = []
+        while len(messages) < count:
+            message = self.get()
+            if message is None:
+                break
+            messages.append(message)
+        return messages
+
+    def report(self) -> dict:
+        """Get the depth and counters of the queue."""
+        return {
+            "depth": self.depth,
+            "peak": self.peak,
+            "queued": self.queued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "writes": self.writes}
 
 
 # Socket wrapper classes
@@ -37,7 +218,8 @@ class SocketHandler:
     """Socket server worker default class.
 
     The socket handler deals with sending and receiving messages from
-    the connected client.
+    the connected client. Messages are sent from an outbound queue by a
+    thread of their own, so a slow client never blocks the server.
     """
 
     def __init__(self, sock: socket.socket, address: str, server):
@@ -46,8 +228,15 @@ class SocketHandler:
         self.address = address
         self.server = server
         self.alive = False
+        self.evicted = False
+        # Whether the client accepts compressed messages
+        self.compression = False
+
+        self.outbound = Outbound(server.low, server.high, server.limit, server.timeout)
+        self.ready = threading.Condition()
 
         self._receive = threading.Thread(target=self.receive, daemon=True)
+        self._transmit = threading.Thread(target=self.transmit, daemon=True)
         logging.info("%s: finished initialization", self)
 
     def __repr__(self):
@@ -55,30 +244,80 @@ class SocketHandler:
 
     def receive(self):
         """Receive loop that queues incoming messages."""
+        reader = FrameReader(self.sock, self.server.maximum)
         while self.alive:
             try:
-                event, data = pickle.loads(recv(self.sock))
-                self.server.queue.put((event, data, self))
+                for message in reader.read():
+                    event, data = codec.decode(message, self.server.maximum)
+                    self.server.queue.put((event, data, self))
             except Exception as e:
                 logging.error("%s receive caught '%s'", self, e)
                 self.server.queue.put((CLIENT_EXITED, None, self))
                 self.stop()
 
+    def transmit(self):
+        """Transmit loop that sends queued messages in batches."""
+        while self.alive:
+            with self.ready:
+                messages = self.outbound.take(BATCH)
+                while not messages and self.alive:
+                    self.ready.wait()
+                    messages = self.outbound.take(BATCH)
+            if not messages:
+                break
+            try:
+                self.outbound.writes += sendmsg(self.sock, gather(messages))
+            except OSError as e:
+                # The receive loop will notice and clean up
+                logging.error("%s transmit caught '%s'", self, e)
+                break
+
     def emit(self, event: str, data: object):
         """Send a message to the connected client."""
-        send(self.sock, pickle.dumps((event, data)))
+        message = codec.encode(event, data)
+        if self.compression:
+            message = self.server.compress(message)
+        self.send(message)
+
+    def send(self, message: bytes, key: object=None):
+        """Queue an encoded message for the connected client."""
+        if self.evicted:
+            return
+        with self.ready:
+            keeping = self.outbound.put(message, key)
+            self.ready.notify()
+        if not keeping:
+            self.evict()
+
+    def evict(self):
+        """Disconnect a client that cannot keep up."""
+        logging.warning("%s: evicted slow client, %s", self, self.outbound.report())
+        self.drop()
+
+    def drop(self):
+        """Disconnect the client, leaving the receive loop to clean up."""
+        self.evicted = True
+        # Wake the receive loop so the client exits as usual
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
 
     def start(self):
         """Start the socket handler."""
         self.alive = True
         self._receive.start()
-        logging.info("%s: started receive loop", self)
+        self._transmit.start()
+        logging.info("%s: started receive and transmit loops", self)
 
     def stop(self):
         """Stop the socket handler."""
         self.alive = False
+        with self.ready:
+            self.ready.notify()
         if self in self.server.handlers:
             self.server.handlers.remove(self)
+        self.sock.close()
         self.server.emit(CLIENT_EXITED, "")
         logging.info("%s: all processes stopped", self)
 
@@ -87,6 +326,20 @@ class SocketServer:
 
     handler = SocketHandler
 
+    # Largest frame accepted in bytes
+    maximum = MAXIMUM
+
+    # Outbound queue watermarks and limits in bytes and seconds
+    low = 64 * 1024
+    high = 512 * 1024
+    limit = 4096 * 1024
+    timeout = 10.0
+
+    # Compression of messages over a threshold in bytes for clients that accept it
+    compression = True
+    threshold = 1024
+    level = 6
+
     def __init__(self, address):
         self.address = address
         self.alive = False
@@ -94,6 +347,9 @@ class SocketServer:
         self.queue = queue.Queue()
         self.handlers = []
         self.bindings = {}
+        # Events due later by time, in order of scheduling
+        self.timers = []
+        self.counter = itertools.count()
 
         self.sock = socket.socket()
         self.sock.bind(self.address)
@@ -101,8 +357,6 @@ class SocketServer:
         self.sock.listen(8)
 
         self.bind("echo", self.echo)
-
-        self._accept = threading.Thread(target=self.accept, daemon=True)
         logging.info("%s: initialized and bound socket", self)
 
     def __repr__(self):
@@ -113,52 +367,280 @@ class SocketServer:
             try:
                 sock, address = self.sock.accept()
                 handler = self.handler(sock, address, self)
-                handler.start()
+                # Register the handler before it can receive anything
                 self.handlers.append(handler)
+                handler.start()
             except Exception as e:
                 logging.error("%s: accept caught '%s'", self, e)
                 self.stop()
 
     def receive(self):
         while self.alive:
-            event, data, handler = self.queue.get()
-            function = self.bindings.get(event)
-            if function is None:
-                logging.warning("%s: caught event '%s' with no binding", self, event)
-            else:
-                function(data, handler)
-
-    def emit(self, event: str, data: object, *handlers: SocketHandler):
+            timeout = None
+            if self.timers:
+                timeout = max(0, self.timers[0][0] - time.monotonic())
+            try:
+                self.dispatch(*self.queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+            # Dispatch the events that are due
+            while self.timers and self.timers[0][0] <= time.monotonic():
+                when, i, event, data = heapq.heappop(self.timers)
+                self.dispatch(event, data, None)
+
+    def dispatch(self, event: str, data: object, handler: SocketHandler):
+        """Call the function bound to an event from a handler."""
+        function = self.bindings.get(event)
+        if function is None:
+            logging.warning("%s: caught event '%s' with no binding", self, event)
+            return
+        try:
+            function(data, handler)
+        except Exception as e:
+            logging.error("%s: dispatch of '%s' caught '%s'", self, event, e)
+            # Only the client that sent the event is dropped
+            if handler is not None and event != CLIENT_EXITED:
+                handler.drop()
+
+    def emit(self, event: str, data: object, *handlers: SocketHandler, exclude: SocketHandler=None, key: object=None):
+        """Send a message to some or all handlers, optionally leaving one out.
+
+        A message with a key may be dropped for a congested handler
+        once a later message with the same key is sent.
+        """
         handlers = handlers or self.handlers
+        # Encode once, and compress at most once, for every recipient
+        message = codec.encode(event, data)
+        compressed = None
         for handler in handlers:
-            handler.emit(event, data)
+            if handler is exclude:
+                continue
+            if handler.compression and compressed is None:
+                compressed = self.compress(message)
+            try:
+                handler.send(compressed if handler.compression else message, key)
+            except OSError as e:
+                # The handler's receive loop will notice and clean up
+                logging.warning("%s: could not emit to %s, %s", self, handler, e)
 
     def bind(self, event, function):
         self.bindings[event] = function
 
+    def compress(self, message: bytes) -> bytes:
+        """Compress an encoded message if it is large enough."""
+        return codec.compress(message, self.threshold, self.level)
+
+    def later(self, delay: float, event: str, data: object=None):
+        """Dispatch an event after a delay in seconds."""
+        # Timers are only scheduled and run on the dispatch thread
+        heapq.heappush(self.timers, (time.monotonic() + delay, next(self.counter), event, data))
+
+    def report(self) -> dict:
+        """Get the outbound queue depth and counters of every handler."""
+        return {handler: handler.outbound.report() for handler in self.handlers}
+
     def echo(self, data, handler):
         handler.emit("echoed from " + self.address[0] + ": " + data)
 
     def start(self):
         self.alive = True
+        self._accept = threading.Thread(target=self.accept, daemon=True)
         self._accept.start()
         logging.info("%s: started server loop", self)
         self.receive()
 
     def stop(self):
         self.alive = False
-        for handler in self.handlers:
+        for handler in self.handlers[:]:
             handler.stop()
         logging.info("%s: stopped all processes", self)
 
 
+class LoopQueue:
+    """Queue-like entry into an event loop from any thread.
+
+    Items put in the queue are handed to a function on the loop, so
+    worker threads can queue events for an asyncio server the same way
+    they would for a threaded one.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, function):
+        """Initialize the queue with its loop and consumer."""
+        self.loop = loop
+        self.function = function
+
+    def put(self, item: tuple):
+        """Schedule an item to be handled on the loop."""
+        self.loop.call_soon_threadsafe(self.function, *item)
+
+
+class AsyncSocketHandler:
+    """Socket server worker for the asyncio engine.
+
+    Mirrors the socket handler over a stream reader and writer, so the
+    connection is served by tasks on the server's event loop rather
+    than threads of its own.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, server):
+        """Initialize a crossword socket handler over a stream."""
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info("peername")
+        self.server = server
+        self.alive = False
+        self.evicted = False
+        # Whether the client accepts compressed messages
+        self.compression = False
+
+        self.outbound = Outbound(server.low, server.high, server.limit, server.timeout)
+        self.ready = asyncio.Event()
+        logging.info("%s: finished initialization", self)
+
+    def __repr__(self):
+        return "AsyncSocketHandler"
+
+    async def receive(self):
+        """Receive loop that dispatches incoming messages."""
+        while self.alive:
+            try:
+                size = LENGTH.unpack(await self.reader.readexactly(LENGTH.size))[0]
+                if size > self.server.maximum:
+                    raise ValueError("frame of %i bytes is over the limit of %i" % (size, self.server.maximum))
+                event, data = codec.decode(await self.reader.readexactly(size), self.server.maximum)
+            except Exception as e:
+                logging.error("%s receive caught '%s'", self, e)
+                # Leave the handlers before the server hears about it
+                self.stop()
+                self.server.dispatch(CLIENT_EXITED, None, self)
+            else:
+                self.server.dispatch(event, data, self)
+
+    async def transmit(self):
+        """Transmit loop that sends queued messages in batches."""
+        while self.alive:
+            messages = self.outbound.take(BATCH)
+            if not messages:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            self.writer.writelines(gather(messages))
+            self.outbound.writes += 1
+            try:
+                # Wait for the transport to drain below its own watermark
+                await self.writer.drain()
+            except Exception as e:
+                # The receive loop will notice and clean up
+                logging.error("%s transmit caught '%s'", self, e)
+                break
+
+    def emit(self, event: str, data: object):
+        """Send a message to the connected client."""
+        message = codec.encode(event, data)
+        if self.compression:
+            message = self.server.compress(message)
+        self.send(message)
+
+    def send(self, message: bytes, key: object=None):
+        """Queue an encoded message for the connected client."""
+        if self.evicted:
+            return
+        keeping = self.outbound.put(message, key)
+        self.ready.set()
+        if not keeping:
+            self.evict()
+
+    def evict(self):
+        """Disconnect a client that cannot keep up."""
+        logging.warning("%s: evicted slow client, %s", self, self.outbound.report())
+        self.drop()
+
+    def drop(self):
+        """Disconnect the client, leaving the receive loop to clean up."""
+        self.evicted = True
+        # Fail the receive loop so the client exits as usual
+        self.writer.transport.abort()
+
+    def start(self):
+        """Start the socket handler."""
+        self.alive = True
+        self._transmit = self.server.loop.create_task(self.transmit())
+        logging.info("%s: started receive and transmit loops", self)
+
+    def stop(self):
+        """Stop the socket handler."""
+        self.alive = False
+        self.ready.set()
+        if self in self.server.handlers:
+            self.server.handlers.remove(self)
+        self.writer.close()
+        self.server.emit(CLIENT_EXITED, "")
+        logging.info("%s: all processes stopped", self)
+
+
+class AsyncSocketServer(SocketServer):
+    """Socket server that serves every client on one event loop.
+
+    Bindings and emits work as in the threaded server, but there are no
+    accept or handler threads. Messages are framed by stream readers
+    and dispatched on the loop as they arrive.
+    """
+
+    handler = AsyncSocketHandler
+
+    def __init__(self, address):
+        super().__init__(address)
+        self.loop = asyncio.new_event_loop()
+        self.queue = LoopQueue(self.loop, self.dispatch)
+
+    def __repr__(self):
+        return "AsyncSocketServer"
+
+    def later(self, delay: float, event: str, data: object=None):
+        """Dispatch an event after a delay in seconds."""
+        self.loop.call_later(delay, self.dispatch, event, data, None)
+
+    async def accept(self):
+        """Start accepting connections on the bound socket."""
+        self._server = await asyncio.start_server(self.connect, sock=self.sock)
+
+    async def connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve a newly connected client until it leaves."""
+        handler = self.handler(reader, writer, self)
+        handler.start()
+        self.handlers.append(handler)
+        await handler.receive()
+
+    def start(self):
+        self.alive = True
+        self.loop.run_until_complete(self.accept())
+        logging.info("%s: started server loop", self)
+        self.loop.run_forever()
+
+    def stop(self):
+        self.alive = False
+        for handler in self.handlers[:]:
+            handler.stop()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        logging.info("%s: stopped all processes", self)
+
+
 class SocketConnection:
 
+    # Largest frame accepted in bytes
+    maximum = MAXIMUM
+
+    # Compression of messages over a threshold in bytes once the server accepts it
+    threshold = 1024
+    level = 6
+
     def __init__(self, address):
         self.address = address
         self.alive = False
+        self.compression = False
 
         self.q = queue.Queue()
+        self.waker = None
 
         self.sock = socket.socket()
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -167,20 +649,31 @@ class SocketConnection:
         self._receive = threading.Thread(target=self.receive, daemon=True)
 
     def receive(self):
+        reader = FrameReader(self.sock, self.maximum)
         while self.alive:
             try:
-                event, data = pickle.loads(recv(self.sock))
-                self.q.put((event, data))
+                messages = reader.read()
+                for message in messages:
+                    self.q.put(codec.decode(message, self.maximum))
+                if messages and self.waker:
+                    self.waker()
             except Exception as e:
                 print("connection receive", e)
                 self.stop()
 
     def emit(self, event: str, data: object):
-        send(self.sock, pickle.dumps((event, data)))
+        message = codec.encode(event, data)
+        if self.compression:
+            message = codec.compress(message, self.threshold, self.level)
+        send(self.sock, message)
 
     def queue(self, q: queue.Queue):
         self.q = q
 
+    def notify(self, function):
+        """Call a function from the receive thread after queueing."""
+        self.waker = function
+
     def start(self):
         self.alive = True
         self._receive.start()
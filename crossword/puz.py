@@ -71,12 +71,13 @@ def read(filename):
         return load(f.read())
 
 
-def load(data):
+def load(data, strict=True):
     """Read .puz file data and return the Puzzle object
     throws PuzzleFormatError if there's any problem with the file format
+    checksums are only validated when strict is set
     """
     puz = Puzzle()
-    puz.load(data)
+    puz.load(data, strict)
     return puz
 
 
@@ -117,7 +118,7 @@ class Puzzle:
         self.solution_state = SolutionState.Unlocked
         self.helpers = {}  # add-ons like Rebus and Markup
 
-    def load(self, data):
+    def load(self, data, strict=True):
         s = PuzzleBuffer(data)
 
         # advance to start - files may contain some data before the start of the puzzle
@@ -172,6 +173,8 @@ class Puzzle:
         if s.can_read():
             self.postscript = s.read_to_end()
 
+        if not strict:
+            return
         if cksum_gbl != self.global_cksum():
             raise PuzzleFormatError('global checksum does not match')
         if cksum_hdr != self.header_cksum():
@@ -194,7 +197,11 @@ class Puzzle:
                 h.save()
 
         # include any preamble text we might have found on read
-        s.write(self.preamble)
+        # preamble is read back as raw bytes but starts out empty
+        if isinstance(self.preamble, bytes):
+            s.write(self.preamble)
+        else:
+            s.write(self.preamble.encode(ENCODING))
 
         s.pack(HEADER_FORMAT,
                self.global_cksum(), ACROSSDOWN.encode(ENCODING),
@@ -230,7 +237,11 @@ class Puzzle:
             s.pack(EXTENSION_HEADER_FORMAT, code, len(data), data_cksum(data))
             s.write(data + b'\0')
 
-        s.write(self.postscript.encode(ENCODING))
+        # postscript is read back as raw bytes
+        if isinstance(self.postscript, bytes):
+            s.write(self.postscript)
+        else:
+            s.write(self.postscript.encode(ENCODING))
 
         return s.tobytes()
 
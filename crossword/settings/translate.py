@@ -10,12 +10,16 @@ def decimal(node):
     return int(node.text.strip())
 
 
+def boolean(node):
+    return string(node) == "True"
+
+
 def font(node):
     return string(node[0]), integer(node[1])
 
 
 def choice(node):
-    return [string(child) for child in node.getchildren()][integer(node)]
+    return [string(child) for child in list(node)][integer(node)]
 
 
 mapping = {
@@ -24,6 +28,7 @@ mapping = {
     "integer": integer,
     "natural": integer,
     "decimal": decimal,
+    "boolean": boolean,
     "font": font,
     "choice": choice,
     "ip": string,
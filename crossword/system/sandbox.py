@@ -0,0 +1,98 @@
+"""Resource-bounded parsing of untrusted puzzles.
+
+Puzzles submitted by clients are parsed in a separate process with its
+size, processor time, and memory bounded, so that a crafted file can
+only ever waste the worker and never the server that asked for it.
+"""
+
+# Import
+import multiprocessing
+from crossword import puz
+
+try:
+    import resource as _resource
+except ImportError:
+    _resource = None
+
+# Rejection reasons
+SIZE = "size"
+TIME = "time"
+MEMORY = "memory"
+FORMAT = "format"
+CRASH = "crash"
+
+# Workers are started clean rather than forked from a threaded server
+# holding client sockets, so the server script must be import safe
+if "forkserver" in multiprocessing.get_all_start_methods():
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__])
+else:
+    context = multiprocessing.get_context("spawn")
+
+
+class Rejection:
+    """Structured reason for refusing an untrusted puzzle."""
+
+    def __init__(self, reason: str, message: str=""):
+        """Initialize a rejection with its reason and a message."""
+        self.reason = reason
+        self.message = message
+
+    def __repr__(self):
+        return "%s rejection: %s" % (self.reason, self.message or "no message")
+
+
+def _limit(memory: int, seconds: int):
+    """Bound the memory and processor time of the current process."""
+    if _resource is None:
+        return
+    # Allow the budget on top of what the interpreter already maps
+    try:
+        with open("/proc/self/statm") as file:
+            used = int(file.read().split()[0]) * _resource.getpagesize()
+    except OSError:
+        used = 0
+    _resource.setrlimit(_resource.RLIMIT_AS, (used + memory, used + memory))
+    _resource.setrlimit(_resource.RLIMIT_CPU, (seconds, seconds + 1))
+
+
+def _parse(connection, data: bytes, memory: int, seconds: int):
+    """Parse the puzzle in the worker and send back the result."""
+    try:
+        _limit(memory, seconds)
+        connection.send(puz.load(data))
+    except puz.PuzzleFormatError as e:
+        connection.send(Rejection(FORMAT, e.message))
+    except MemoryError:
+        connection.send(Rejection(MEMORY, "exceeded %i bytes" % memory))
+    except Exception as e:
+        connection.send(Rejection(FORMAT, str(e)))
+    finally:
+        connection.close()
+
+
+def parse(data: bytes, size: int, seconds: int, memory: int):
+    """Parse puzzle data in a bounded worker process.
+
+    Returns the parsed puzzle or a rejection. The call blocks for at
+    most the time limit, so it should be run off any event thread.
+    """
+    if len(data) > size:
+        return Rejection(SIZE, "%i bytes is over the %i byte limit" % (len(data), size))
+    # Start the worker with its own end of the pipe
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_parse, args=(sender, data, memory, seconds), daemon=True)
+    process.start()
+    sender.close()
+    # Wait for a result, killing the worker if it runs out of time
+    try:
+        if receiver.poll(seconds):
+            return receiver.recv()
+        process.kill()
+        return Rejection(TIME, "took longer than %i seconds" % seconds)
+    except EOFError:
+        process.join()
+        return Rejection(CRASH, "worker exited with code %s" % process.exitcode)
+    finally:
+        receiver.close()
+        process.join()
@@ -0,0 +1,618 @@
+"""Crossword benchmarks.
+
+Run with `python -m crossword.utility.benchmark [name ...]` from the
+repository root to time the model against standard, Sunday, and jumbo
+grids. Puzzles are generated so the results do not depend on the
+puzzles that happen to be on disk.
+"""
+
+# Import
+import sys
+import time
+import array
+import socket
+import struct
+import pickle
+import random
+import timeit
+import logging
+import selectors
+import threading
+import tracemalloc
+import tempfile
+import shutil
+import types
+import queue
+import tkinter
+from crossword import puz
+from crossword.application import model
+from crossword.application import layout
+from crossword.network import codec
+from crossword.network import wrapper
+from crossword.utility.synthetic import synthetic
+from crossword.constants import *
+
+# Grid sizes to benchmark
+SIZES = {"standard": (15, 15), "sunday": (21, 21), "jumbo": (50, 50)}
+
+
+def timed(function, number: int=10) -> float:
+    """Get the best time in seconds of a single call to a function."""
+    return min(timeit.repeat(function, number=number, repeat=5)) / number
+
+
+def construction():
+    """Time building a puzzle model with a computed, loaded, and cached layout."""
+    print("%-10s %12s %12s %12s" % ("grid", "uncached ms", "disk ms", "cached ms"))
+    directory = tempfile.mkdtemp()
+    try:
+        for name, (width, height) in SIZES.items():
+            puzzle = synthetic(width, height)
+            # Uncached construction computes the layout every time
+            def uncached():
+                layout.cache.layouts.clear()
+                model.PuzzleModel(puzzle)
+            cold = timed(uncached)
+            # Disk construction reads the layout file saved by the first build
+            previous, layout.cache = layout.cache, layout.LayoutCache(directory)
+            def loaded():
+                layout.cache.layouts.clear()
+                model.PuzzleModel(puzzle)
+            try:
+                read = timed(loaded)
+            finally:
+                layout.cache = previous
+            warm = timed(lambda: model.PuzzleModel(puzzle))
+            print("%-10s %12.3f %12.3f %12.3f" % (name, cold*1000, read*1000, warm*1000))
+    finally:
+        shutil.rmtree(directory)
+
+
+def allocated(function) -> tuple:
+    """Get the result of a function and the bytes it left allocated."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = function()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def memory():
+    """Measure the memory held by the puzzle model of a room."""
+    print("%-10s %8s %10s %14s %12s" % ("grid", "cells", "backend", "bytes/cell", "KiB/room"))
+    for name, (width, height) in SIZES.items():
+        puzzle = synthetic(width, height)
+        # Warm the layout cache since it is shared between rooms
+        model.PuzzleModel(puzzle)
+        for backend, cells in (("objects", model.CellsAccess), ("arrays", model.ArrayCellsAccess)):
+            room, size = allocated(lambda: model.PuzzleModel(puzzle, cells))
+            print("%-10s %8i %10s %14.1f %12.1f" % (name, len(room.cells), backend, size / len(room.cells), size / 1024))
+
+
+def bulk():
+    """Time whole board operations for each cells access."""
+    print("%-10s %10s %10s %10s %10s %10s" % ("grid", "backend", "check ms", "count ms", "pickle ms", "clear ms"))
+    for name, (width, height) in SIZES.items():
+        puzzle = synthetic(width, height)
+        for backend, cells in (("objects", model.CellsAccess), ("arrays", model.ArrayCellsAccess)):
+            room = model.PuzzleModel(puzzle, cells)
+            for i, letter in enumerate(puzzle.solution):
+                if letter != EMPTY:
+                    room.cells.write(i, letter if i % 7 else "X", i % 3 + 1)
+            check = timed(room.cells.incorrect)
+            count = timed(lambda: room.cells.count(1))
+            # Large object graphs can be too deep to pickle at all
+            try:
+                dump = "%10.3f" % (timed(lambda: pickle.dumps(room.cells)) * 1000)
+            except RecursionError:
+                dump = "%10s" % "too deep"
+            clear = timed(room.cells.clear)
+            print("%-10s %10s %10.3f %10.3f %s %10.3f" % (name, backend, check*1000, count*1000, dump, clear*1000))
+
+
+def typing():
+    """Time the word and clue lookups of typing through every word."""
+    print("%-10s %10s %14s %14s" % ("grid", "keys", "list.index us", "ordinals us"))
+    for name, (width, height) in SIZES.items():
+        room = model.PuzzleModel(synthetic(width, height), model.ArrayCellsAccess)
+        keys = [(room.cells[i], direction) for direction in (ACROSS, DOWN)
+                for word in room.words[direction] for i in word.cells.indices]
+        # Lookups as they were done with per-call dicts and list.index
+        def searched():
+            for cell, direction in keys:
+                word = {ACROSS: cell.across, DOWN: cell.down}[direction]
+                {ACROSS: room.words.across, DOWN: room.words.down}[direction].index(word)
+        def indexed():
+            for cell, direction in keys:
+                room.words.index(cell.word[direction])
+        before = timed(searched, 1)
+        after = timed(indexed, 1)
+        print("%-10s %10i %14.3f %14.3f" % (name, len(keys), before / len(keys) * 1e6, after / len(keys) * 1e6))
+
+
+def payload():
+    """Compare the pickled size and join time of a room's model."""
+    print("%-10s %12s %12s %12s %12s" % ("grid", "graph bytes", "slim bytes", "graph ms", "slim ms"))
+    for name, (width, height) in SIZES.items():
+        puzzle = synthetic(width, height)
+        rooms = [model.PuzzleModel(puzzle, cells) for cells in (model.CellsAccess, model.ArrayCellsAccess)]
+        for room in rooms:
+            for i, letter in enumerate(puzzle.solution):
+                if letter != EMPTY and i % 2:
+                    room.write(*model.to_position(i, width), letter, 1)
+        old, room = rooms
+        slim = pickle.dumps(room)
+        join = timed(lambda: pickle.loads(pickle.dumps(room)))
+        # The whole cell model graph, as the model was pickled before,
+        # which needs more than the default recursion limit past 15x15
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, 20 * len(old.cells)))
+        try:
+            graph = pickle.dumps(vars(old))
+            before = timed(lambda: pickle.loads(pickle.dumps(vars(old))))
+        finally:
+            sys.setrecursionlimit(limit)
+        print("%-10s %12i %12i %12.3f %12.3f" % (name, len(graph), len(slim), before*1000, join*1000))
+
+
+def snapshots():
+    """Time taking, diffing, and restoring board snapshots."""
+    print("%-10s %12s %12s %12s %12s" % ("grid", "copy us", "snapshot us", "diff us", "restore us"))
+    for name, (width, height) in SIZES.items():
+        puzzle = synthetic(width, height)
+        room = model.PuzzleModel(puzzle, model.ArrayCellsAccess)
+        letters = [i for i, letter in enumerate(puzzle.solution) if letter != EMPTY]
+        # A full copy of the fill as the alternative to a snapshot
+        copy = timed(room.cells.fill)
+        snapshot = timed(room.snapshot)
+        # Two snapshots a few typed letters apart
+        before = room.snapshot()
+        for i in letters[::len(letters) // 5][:5]:
+            room.write(*model.to_position(i, width), "A", 1)
+        after = room.snapshot()
+        diff = timed(lambda: before.diff(after))
+        restore = timed(lambda: (room.restore(before), room.restore(after)), 1) / 2
+        print("%-10s %12.3f %12.3f %12.3f %12.3f" % (name, copy*1e6, snapshot*1e6, diff*1e6, restore*1e6))
+
+
+# Clients connected and position updates sent by each in the load test
+CONNECTIONS = (10, 50, 100)
+UPDATES = 20
+
+
+def frame(event: str, data: object) -> bytes:
+    """Pack a message as it is sent over the wire."""
+    return wrapper.frame(codec.encode(event, data))
+
+
+def drain(sockets: list, event: str, expected: int, timeout: float=60, match=None) -> int:
+    """Read frames from client sockets until enough of an event arrive."""
+    selector = selectors.DefaultSelector()
+    for sock in sockets:
+        selector.register(sock, selectors.EVENT_READ, wrapper.FrameReader(sock))
+    received = 0
+    deadline = time.time() + timeout
+    while received < expected and time.time() < deadline:
+        for key, mask in selector.select(1):
+            # Count every complete frame read
+            for message in key.data.read():
+                kind, data = codec.decode(message)
+                received += kind == event and (match is None or match(data))
+    selector.close()
+    return received
+
+
+def load():
+    """Compare the server engines under many clients sending updates."""
+    # The network modules load the settings
+    from crossword.network import custom
+    print("%-10s %8s %10s %12s %12s" % ("engine", "clients", "join s", "messages", "messages/s"))
+    # Server logging would dominate the measurements
+    logging.disable(logging.CRITICAL)
+    for name, engine in custom.ENGINES.items():
+        for clients in CONNECTIONS:
+            server = engine(("127.0.0.1", 0))
+            # Forward every cursor move rather than merging them
+            server.tick = 0
+            threading.Thread(target=server.start, daemon=True).start()
+            address = server.sock.getsockname()
+            # Connect and join every client
+            start = time.time()
+            sockets = []
+            for i in range(clients):
+                sockets.append(socket.create_connection(address))
+                sockets[-1].sendall(frame(CLIENT_JOINED, {NAME: str(i), COLOR: COLORS[0]}))
+            while len(server.players) < clients:
+                time.sleep(0.01)
+            joined = time.time() - start
+            drain(sockets, None, 0, 0)
+            # Every update is forwarded to every other client
+            expected = clients * UPDATES * (clients - 1)
+            def send():
+                for j in range(UPDATES):
+                    for sock in sockets:
+                        sock.sendall(frame(CLIENT_UPDATED, {POSITION: (j, j)}))
+            start = time.time()
+            threading.Thread(target=send, daemon=True).start()
+            received = drain(sockets, CLIENT_UPDATED, expected)
+            elapsed = time.time() - start
+            print("%-10s %8i %10.3f %12i %12.0f" % (name, clients, joined, received, received / elapsed))
+            for sock in sockets:
+                sock.close()
+    logging.disable(logging.NOTSET)
+
+
+def joined(sock: socket.socket, size: int) -> bytes:
+    """Receive a number of bytes by joining packets, as frames were read before."""
+    message = b""
+    while len(message) < size:
+        message += sock.recv(size - len(message))
+    return message
+
+
+def framing():
+    """Compare reading frames by joining packets and into a reusable buffer."""
+    print("%-10s %8s %10s %14s %14s" % ("message", "frames", "bytes", "joined MB/s", "buffer MB/s"))
+    puzzle = synthetic(*SIZES["jumbo"])
+    room = model.PuzzleModel(puzzle, model.ArrayCellsAccess, puzzle.tobytes())
+    for name, message, count in (
+            ("position", codec.encode(CLIENT_UPDATED, {POSITION: (7, 3)}), 200000),
+            ("puzzle", codec.encode(PUZZLE_UPDATED, room), 200),
+            ("upload", bytes(4 * 1024**2), 4)):
+        data = wrapper.frame(message) * count
+        rates = []
+        for buffered in (False, True):
+            a, b = socket.socketpair()
+            threading.Thread(target=a.sendall, args=(data,), daemon=True).start()
+            start = time.perf_counter()
+            if buffered:
+                reader = wrapper.FrameReader(b)
+                received = 0
+                while received < count:
+                    received += len(reader.read())
+            else:
+                for i in range(count):
+                    joined(b, wrapper.LENGTH.unpack(joined(b, wrapper.LENGTH.size))[0])
+            rates.append(len(data) / (time.perf_counter() - start) / 1024**2)
+            a.close()
+            b.close()
+        print("%-10s %8i %10i %14.1f %14.1f" % (name, count, len(message), *rates))
+
+
+# Players and rounds of cursor moves in the chatter test
+CHATTERERS = 20
+ROUNDS = 100
+
+
+def chatter():
+    """Count the cursor moves broadcast with and without a server tick."""
+    from crossword.network import custom
+    print("%-10s %8s %10s %10s %12s %10s" % ("engine", "tick ms", "moves", "letters", "broadcasts", "received"))
+    logging.disable(logging.CRITICAL)
+    puzzle = synthetic(*SIZES["standard"])
+    cells = [model.to_position(i, puzzle.width) for i, c in enumerate(puzzle.fill) if not puz.is_blacksquare(c)]
+    for name, engine in custom.ENGINES.items():
+        for tick in (0, 30):
+            server = engine(("127.0.0.1", 0))
+            server.tick = tick / 1000
+            server.model = model.PuzzleModel(puzzle, model.ArrayCellsAccess, puzzle.tobytes())
+            threading.Thread(target=server.start, daemon=True).start()
+            address = server.sock.getsockname()
+            sockets = [socket.create_connection(address) for i in range(CHATTERERS)]
+            for i, sock in enumerate(sockets):
+                sock.sendall(frame(CLIENT_JOINED, {NAME: str(i), COLOR: COLORS[0]}))
+            while len(server.players) < CHATTERERS:
+                time.sleep(0.01)
+            drain(sockets, None, 0, 0)
+            before = sum(handler.outbound.queued for handler in server.handlers)
+            # Every player moves every few milliseconds and types every fifth move
+            letters = ROUNDS // 5 * CHATTERERS
+            def send():
+                for j in range(ROUNDS):
+                    for i, sock in enumerate(sockets):
+                        x, y = cells[(i * ROUNDS + j) % len(cells)]
+                        sock.sendall(frame(CLIENT_UPDATED, {POSITION: (x, y)}))
+                        if j % 5 == 4:
+                            sock.sendall(frame(CLIENT_UPDATED, {LETTER: (x, y, "A", j + 1)}))
+                    time.sleep(0.005)
+            threading.Thread(target=send, daemon=True).start()
+            received = drain(sockets, CLIENT_UPDATED, letters * (CHATTERERS - 1), 30, lambda data: LETTER in data[1])
+            # Let the last tick go out
+            time.sleep(0.1)
+            broadcasts = sum(handler.outbound.queued for handler in server.handlers) - before
+            print("%-10s %8i %10i %10i %12i %10i" % (name, tick, ROUNDS * CHATTERERS, letters, broadcasts, received))
+            for sock in sockets:
+                sock.close()
+    logging.disable(logging.NOTSET)
+
+
+# Readers kept up to date while one client stalls in the backpressure test
+READERS = 10
+
+
+def backpressure():
+    """Check that a stalled client is evicted without holding up the rest."""
+    from crossword.network import custom
+    print("%-10s %10s %10s %10s %10s %10s %10s %10s" % (
+        "engine", "letters", "received", "letters/s", "skipped", "dropped", "peak KB", "evicted"))
+    logging.disable(logging.CRITICAL)
+    puzzle = synthetic(*SIZES["standard"])
+    cells = [model.to_position(i, puzzle.width) for i, c in enumerate(puzzle.fill) if not puz.is_blacksquare(c)]
+    for name, engine in custom.ENGINES.items():
+        server = engine(("127.0.0.1", 0))
+        server.low, server.high, server.limit, server.timeout = 16 * 1024, 64 * 1024, 256 * 1024, 0.5
+        server.tick = 0
+        server.model = model.PuzzleModel(puzzle, model.ArrayCellsAccess, puzzle.tobytes())
+        threading.Thread(target=server.start, daemon=True).start()
+        address = server.sock.getsockname()
+        # The stalled client never reads, so its socket buffers fill up
+        stalled = socket.socket()
+        stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        stalled.connect(address)
+        stalled.sendall(frame(CLIENT_JOINED, {NAME: "stalled", COLOR: COLORS[0]}))
+        sockets = [socket.create_connection(address) for i in range(READERS)]
+        for i, sock in enumerate(sockets):
+            sock.sendall(frame(CLIENT_JOINED, {NAME: str(i), COLOR: COLORS[0]}))
+        while len(server.players) < READERS + 1:
+            time.sleep(0.01)
+        # Shrink the server side buffer too so the stall reaches the queue
+        handler = server.handlers[0]
+        sock = handler.writer.get_extra_info("socket") if hasattr(handler, "writer") else handler.sock
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        drain(sockets, None, 0, 0)
+        # One reader moves and types while the others keep up
+        letters = UPDATES * len(cells)
+        def send():
+            for j in range(UPDATES):
+                for x, y in cells:
+                    sockets[0].sendall(frame(CLIENT_UPDATED, {POSITION: (x, y)}))
+                    sockets[0].sendall(frame(CLIENT_UPDATED, {LETTER: (x, y, "A", j + 1)}))
+        readers = server.handlers[2:]
+        start = time.time()
+        threading.Thread(target=send, daemon=True).start()
+        # Cursor moves may be superseded under load but letters never are
+        received = drain(sockets[1:], CLIENT_UPDATED, letters * (READERS - 1), 30, lambda data: LETTER in data[1])
+        elapsed = time.time() - start
+        skipped = sum(reader.outbound.dropped for reader in readers)
+        # The next update evicts the stalled client once it has been over for too long
+        time.sleep(server.timeout)
+        sockets[0].sendall(frame(CLIENT_UPDATED, {POSITION: (0, 0)}))
+        while not handler.evicted and time.time() - start < 60:
+            time.sleep(0.01)
+        report = handler.outbound.report()
+        print("%-10s %10i %10i %10.0f %10i %10i %10.0f %10s" % (
+            name, letters, received, received / elapsed, skipped, report["dropped"], report["peak"] / 1024, handler.evicted))
+        for sock in sockets + [stalled]:
+            sock.close()
+    logging.disable(logging.NOTSET)
+
+
+# Remote updates in a burst and the old polling interval in milliseconds
+BURST = 40
+POLL = 50
+
+
+def latency():
+    """Time how long remote updates take to be handled by the Tk loop."""
+    from crossword.application import controller
+    print("%-10s %10s %10s %10s" % ("loop", "updates", "mean ms", "max ms"))
+    # A Tcl interpreter runs the same event loop without a display
+    root = tkinter.Tcl()
+    delays = []
+    sent = [0] * BURST
+    # Letters typed into different cells so none are coalesced
+    def handle(data):
+        delays.append(time.perf_counter() - sent[data[1][LETTER][0]])
+    events = queue.Queue()
+    bindings = {CLIENT_UPDATED: handle}
+    client = types.SimpleNamespace(dispatcher=controller.Dispatcher(events, bindings, 0.008))
+    client.view = types.SimpleNamespace(root=root)
+    # The old loop handled one event per poll
+    def poll():
+        if not events.empty():
+            event, data = events.get()
+            bindings[event](data)
+        root.after(POLL, poll)
+    wakeup = controller.Wakeup(root, lambda: controller.Controller.update(client))
+    for name, waker in (("poll", None), ("wakeup", wakeup)):
+        delays.clear()
+        if waker is None:
+            root.after(POLL, poll)
+        def burst():
+            time.sleep(0.1)
+            for i in range(BURST):
+                sent[i] = time.perf_counter()
+                events.put((CLIENT_UPDATED, (1, {LETTER: (i, 0, "A", i + 1)})))
+                if waker:
+                    waker()
+        threading.Thread(target=burst, daemon=True).start()
+        # Without windows the main loop would return right away
+        while len(delays) < BURST:
+            root.tk.dooneevent()
+        for identifier in root.tk.call("after", "info"):
+            root.after_cancel(identifier)
+        print("%-10s %10i %10.3f %10.3f" % (name, BURST, sum(delays) / BURST * 1000, max(delays) * 1000))
+    wakeup.close()
+
+
+def coalescing():
+    """Count the client updates left after coalescing a frame."""
+    from crossword.application import controller
+    print("%-8s %8s %10s %10s %10s %10s" % ("players", "cells", "received", "coalesced", "applied", "frame ms"))
+    generator = random.Random(0)
+    for players, cells in ((2, 4), (4, 16), (8, 64)):
+        events = queue.Queue()
+        dispatcher = controller.Dispatcher(events, {CLIENT_UPDATED: lambda data: None}, 0.008)
+        # Every player moves and types through a few cells
+        for stamp in range(1, 201):
+            pid = generator.randrange(players) + 1
+            x, y = divmod(generator.randrange(cells), 8)
+            events.put((CLIENT_UPDATED, (pid, {POSITION: (x, y)})))
+            events.put((CLIENT_UPDATED, (pid, {LETTER: (x, y, "A", stamp)})))
+        start = time.perf_counter()
+        dispatcher.update()
+        elapsed = time.perf_counter() - start
+        frame = dispatcher.frame
+        print("%-8i %8i %10i %10i %10i %10.3f" % (
+            players, cells, frame["received"], frame["coalesced"], frame["applied"], elapsed*1000))
+
+
+def messages() -> dict:
+    """Get typical messages of each kind by name."""
+    players = []
+    for i in range(10):
+        player = model.PlayerModel("player %i" % i, COLORS[i % len(COLORS)])
+        player.id, player.x, player.y = 140000000000000 + i, i, i
+        players.append(player)
+    return {
+        "position": (CLIENT_UPDATED, {POSITION: (7, 3)}),
+        "direction": (CLIENT_UPDATED, {DIRECTION: DOWN}),
+        "letter": (CLIENT_UPDATED, {LETTER: (7, 3, "A", 1024)}),
+        "forwarded": (CLIENT_UPDATED, (140000000000000, {LETTER: (7, 3, "A", 1024)})),
+        "clients": (SERVER_UPDATED, {CLIENTS: players}),
+        "joined": (CLIENT_JOINED, {NAME: "player", COLOR: COLORS[0]})}
+
+
+def wire():
+    """Compare message sizes and coding times of the codec and pickle."""
+    print("%-10s %12s %12s %14s %14s" % ("message", "pickle bytes", "codec bytes", "pickle us", "codec us"))
+    for name, (event, data) in messages().items():
+        pickled = pickle.dumps((event, data))
+        encoded = codec.encode(event, data)
+        before = timed(lambda: pickle.loads(pickle.dumps((event, data))), 1000)
+        after = timed(lambda: codec.decode(codec.encode(event, data)), 1000)
+        print("%-10s %12i %12i %14.3f %14.3f" % (name, len(pickled), len(encoded), before*1e6, after*1e6))
+
+
+class Sink(wrapper.SocketHandler):
+    """Socket handler that counts the bytes sent to it."""
+
+    def __init__(self, server=None, compression: bool=False):
+        """Initialize the sink without a socket."""
+        self.server = server
+        self.sent = 0
+        self.compression = compression
+
+    def send(self, message: bytes, key: object=None):
+        """Count the bytes of a framed message."""
+        self.sent += len(message)
+
+
+def fanout():
+    """Compare broadcasting a jumbo puzzle per recipient and encoded once."""
+    print("%-8s %12s %12s %12s" % ("clients", "each ms", "once ms", "MB sent"))
+    puzzle = synthetic(*SIZES["jumbo"])
+    room = model.PuzzleModel(puzzle, model.ArrayCellsAccess, puzzle.tobytes())
+    server = wrapper.SocketServer(("127.0.0.1", 0))
+    for clients in CONNECTIONS:
+        server.handlers = [Sink() for i in range(clients)]
+        # Both ways send the same bytes over five rounds of three broadcasts
+        each = timed(lambda: [handler.emit(PUZZLE_UPDATED, room) for handler in server.handlers], 3)
+        once = timed(lambda: server.emit(PUZZLE_UPDATED, room), 3)
+        sent = server.handlers[0].sent * clients / 30
+        print("%-8i %12.3f %12.3f %12.2f" % (clients, each*1000, once*1000, sent / 1024**2))
+    server.sock.close()
+
+
+def compression():
+    """Compare the sizes of large messages and broadcasting them compressed."""
+    print("%-10s %10s %10s %12s %12s %12s" % ("grid", "raw KB", "zlib KB", "upload KB", "each ms", "once ms"))
+    server = wrapper.SocketServer(("127.0.0.1", 0))
+    for name, (width, height) in SIZES.items():
+        puzzle = synthetic(width, height)
+        data = puzzle.tobytes()
+        room = model.PuzzleModel(puzzle, model.ArrayCellsAccess, data)
+        message = codec.encode(PUZZLE_UPDATED, room)
+        upload = server.compress(codec.encode(PUZZLE_SUBMITTED, data))
+        # Compressing for every recipient against once per broadcast
+        server.handlers = [Sink(server, True) for i in range(CONNECTIONS[0])]
+        each = timed(lambda: [handler.emit(PUZZLE_UPDATED, room) for handler in server.handlers], 3)
+        once = timed(lambda: server.emit(PUZZLE_UPDATED, room), 3)
+        print("%-10s %10.1f %10.1f %12.1f %12.3f %12.3f" % (
+            name, len(message) / 1024, len(server.compress(message)) / 1024, len(upload) / 1024, each*1000, once*1000))
+    server.sock.close()
+
+
+class Unbatched(wrapper.SocketHandler):
+    """Socket handler that frames and sends every message on its own."""
+
+    def transmit(self):
+        """Transmit loop that sends queued messages one by one."""
+        while self.alive:
+            with self.ready:
+                message = self.outbound.get()
+                while message is None and self.alive:
+                    self.ready.wait()
+                    message = self.outbound.get()
+            if message is None:
+                break
+            try:
+                self.sock.sendall(wrapper.frame(message))
+            except OSError:
+                break
+            self.outbound.writes += 1
+
+
+# Messages broadcast in the batching test
+BROADCASTS = 20000
+
+
+def broadcast():
+    """Compare sends per message with and without scatter-gather batches."""
+    print("%-10s %8s %10s %12s %12s" % ("handler", "clients", "messages", "writes/msg", "messages/s"))
+    logging.disable(logging.CRITICAL)
+    for name, handler in (("unbatched", Unbatched), ("batched", wrapper.SocketHandler)):
+        for clients in CONNECTIONS[:2]:
+            server = wrapper.SocketServer(("127.0.0.1", 0))
+            pairs = [socket.socketpair() for i in range(clients)]
+            for a, b in pairs:
+                server.handlers.append(handler(a, "pair", server))
+                server.handlers[-1].start()
+            start = time.time()
+            for i in range(BROADCASTS):
+                server.emit(CLIENT_UPDATED, (1, {POSITION: (i % 15, i // 15 % 15)}))
+            received = drain([b for a, b in pairs], CLIENT_UPDATED, BROADCASTS * clients, 30)
+            elapsed = time.time() - start
+            writes = sum(other.outbound.writes for other in server.handlers)
+            print("%-10s %8i %10i %12.3f %12.0f" % (name, clients, received, writes / received, received / elapsed))
+            for a, b in pairs:
+                a.close()
+                b.close()
+            server.sock.close()
+    logging.disable(logging.NOTSET)
+
+
+benchmarks = {
+    "construction": construction,
+    "memory": memory,
+    "bulk": bulk,
+    "typing": typing,
+    "payload": payload,
+    "snapshots": snapshots,
+    "load": load,
+    "backpressure": backpressure,
+    "chatter": chatter,
+    "latency": latency,
+    "coalescing": coalescing,
+    "wire": wire,
+    "framing": framing,
+    "fanout": fanout,
+    "compression": compression,
+    "broadcast": broadcast,
+}
+
+
+def main(names: list):
+    """Run the named benchmarks or all of them."""
+    # Keep layouts in memory so benchmarks leave nothing on disk
+    layout.cache = layout.LayoutCache()
+    for name in names or benchmarks:
+        print("[%s]" % name)
+        benchmarks[name]()
+        print()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,282 @@
+"""Crossword puzzle library tools.
+
+The bulk loader walks directories of .puz files and maps a function
+over them in worker processes, a batch at a time, so that whole
+libraries can be processed with memory that does not grow with their
+size. Commands built on it are run through the library.py script.
+"""
+
+# Import
+import os
+import time
+import struct
+import shutil
+import tempfile
+import functools
+import string
+import argparse
+import itertools
+import collections
+import multiprocessing
+from crossword import puz
+from crossword.application import layout as _layout
+from crossword.constants import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Paths handed to the workers at a time
+BATCH = 256
+
+
+# Bulk loader
+def walk(*paths: str):
+    """Yield every puzzle file in the given files and directories."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for directory, folders, files in os.walk(path):
+            folders.sort()
+            for name in sorted(files):
+                if name.lower().endswith(".puz"):
+                    yield os.path.join(directory, name)
+
+
+def load(path: str, strict: bool=True) -> puz.Puzzle:
+    """Load a single puzzle from the library."""
+    with open(path, "rb") as file:
+        return puz.load(file.read(), strict)
+
+
+def write(path: str, data: bytes):
+    """Atomically replace a file in the library."""
+    directory, name = os.path.split(path)
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=name, suffix=".tmp", delete=False) as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    shutil.copymode(path, file.name)
+    os.replace(file.name, path)
+
+
+def imap(function, items, processes: int=None, batch: int=BATCH):
+    """Map a function over puzzle paths in worker processes.
+
+    Results come back in no particular order. Items are handed out in
+    batches so that neither the input nor the results pile up.
+    """
+    items = iter(items)
+    processes = processes or os.cpu_count() or 1
+    with multiprocessing.Pool(processes) as pool:
+        while True:
+            chunk = list(itertools.islice(items, batch))
+            if not chunk:
+                break
+            yield from pool.imap_unordered(function, chunk, chunksize=max(1, batch // (4*processes)))
+
+
+# Statistics
+def frequencies(data: bytes) -> list:
+    """Count the occurrences of every byte value in the data."""
+    if numpy is not None:
+        return numpy.bincount(numpy.frombuffer(data, numpy.uint8), minlength=256).tolist()
+    counts = [0] * 256
+    for byte, count in collections.Counter(data).items():
+        counts[byte] = count
+    return counts
+
+
+class Statistics:
+    """Mergeable aggregate statistics over a set of puzzles.
+
+    Everything is kept as fixed-size counts and histograms, so merging
+    the statistics of any number of puzzles takes constant memory.
+    """
+
+    def __init__(self):
+        """Initialize empty statistics."""
+        self.puzzles = 0
+        self.failed = 0
+        self.cells = 0
+        self.black = 0
+        self.letters = [0] * 256
+        self.lengths = collections.Counter()
+        self.rebus = 0
+        self.rebus_cells = 0
+        self.clues = collections.Counter()
+
+    def add(self, puzzle: puz.Puzzle):
+        """Add a single puzzle to the statistics."""
+        self.puzzles += 1
+        solution = puzzle.solution.encode(puz.ENCODING)
+        counts = frequencies(solution)
+        self.cells += len(solution)
+        self.black += counts[ord(EMPTY)]
+        for i, count in enumerate(counts):
+            self.letters[i] += count
+        # Word lengths come straight from the layout offsets, computed
+        # rather than cached so memory does not grow with distinct grids
+        offsets = _layout.Layout.compute(puzzle).offsets
+        self.lengths.update(b - a for a, b in zip(offsets, offsets[1:]))
+        # Rebus squares and clue lengths
+        if puzzle.has_rebus():
+            self.rebus += 1
+            self.rebus_cells += len(puzzle.rebus().get_rebus_squares())
+        self.clues.update(map(len, puzzle.clues))
+
+    def merge(self, other):
+        """Merge other statistics into these."""
+        self.puzzles += other.puzzles
+        self.failed += other.failed
+        self.cells += other.cells
+        self.black += other.black
+        for i, count in enumerate(other.letters):
+            self.letters[i] += count
+        self.lengths.update(other.lengths)
+        self.rebus += other.rebus
+        self.rebus_cells += other.rebus_cells
+        self.clues.update(other.clues)
+        return self
+
+    def report(self) -> str:
+        """Format the statistics as a human readable report."""
+        lines = ["puzzles: %i (%i failed to load)" % (self.puzzles, self.failed)]
+        if not self.puzzles:
+            return "\n".join(lines)
+        letters = sum(self.letters[ord(c)] for c in string.ascii_uppercase)
+        lines.append("black square density: %.2f%%" % (100 * self.black / self.cells))
+        lines.append("rebus puzzles: %i (%.2f%%), rebus cells: %i" % (
+            self.rebus, 100 * self.rebus / self.puzzles, self.rebus_cells))
+        clues = sum(self.clues.values())
+        lines.append("clues: %i, mean length %.1f, longest %i" % (
+            clues, sum(k*v for k, v in self.clues.items()) / max(clues, 1), max(self.clues, default=0)))
+        lines.append("word lengths:")
+        words = sum(self.lengths.values())
+        for length in sorted(self.lengths):
+            lines.append("  %2i: %7i (%.2f%%)" % (length, self.lengths[length], 100 * self.lengths[length] / words))
+        lines.append("letter frequencies:")
+        for c in string.ascii_uppercase:
+            lines.append("  %s: %7i (%.2f%%)" % (c, self.letters[ord(c)], 100 * self.letters[ord(c)] / max(letters, 1)))
+        return "\n".join(lines)
+
+
+def measure(paths: list) -> Statistics:
+    """Compute the statistics of a group of puzzle files."""
+    statistics = Statistics()
+    for path in paths:
+        try:
+            statistics.add(load(path))
+        except Exception:
+            # Anything unreadable only counts as a failure
+            statistics.failed += 1
+    return statistics
+
+
+def stats(paths: list, processes: int=None, group: int=16) -> Statistics:
+    """Compute the merged statistics of every puzzle in the paths.
+
+    Each worker reduces a group of puzzles before handing back its
+    partial statistics, which are merged as they arrive.
+    """
+    paths = walk(*paths)
+    groups = iter(lambda: list(itertools.islice(paths, group)), [])
+    total = Statistics()
+    for partial in imap(measure, groups, processes):
+        total.merge(partial)
+    return total
+
+
+# Checksum repair
+def checksums(data: bytes, puzzle: puz.Puzzle) -> list:
+    """Get the name, position, and size of every checksum field in puzzle data."""
+    start = len(puzzle.preamble)
+    fields = [("global", start, 2), ("header", start + 14, 2), ("magic", start + 16, 8)]
+    # Extensions are written last, right before the postscript
+    postscript = puzzle.postscript
+    if not isinstance(postscript, bytes):
+        postscript = postscript.encode(puz.ENCODING)
+    position = len(data) - len(postscript)
+    position -= sum(9 + len(value) for value in puzzle.extensions.values() if value)
+    size = struct.calcsize(puz.EXTENSION_HEADER_FORMAT)
+    while position + size <= len(data) - len(postscript):
+        code, length, cksum = struct.unpack_from(puz.EXTENSION_HEADER_FORMAT, data, position)
+        fields.append(("extension %s" % code.decode(puz.ENCODING), position + 6, 2))
+        position += size + length + 1
+    return fields
+
+
+def repair(path: str, dry: bool=False) -> tuple:
+    """Recompute the checksums of a puzzle file and rewrite it if needed.
+
+    Returns the path, the number of bytes read, the names of the
+    checksums that were wrong or None if nothing changed, and an error
+    message if the file could not be parsed or differs from its
+    rewritten form in more than its checksums.
+    """
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+        puzzle = puz.load(data, strict=False)
+        fixed = puzzle.tobytes()
+    except Exception as e:
+        return path, 0, None, str(e) or type(e).__name__
+    if fixed == data:
+        return path, len(data), None, None
+    # Only rewrite files that are identical once their checksums are fixed
+    if len(fixed) != len(data):
+        return path, len(data), None, "unrepairable, not only checksums differ"
+    patched = bytearray(data)
+    found = []
+    for name, position, size in checksums(fixed, puzzle):
+        if data[position:position+size] != fixed[position:position+size]:
+            patched[position:position+size] = fixed[position:position+size]
+            found.append(name)
+    if patched != fixed:
+        return path, len(data), None, "unrepairable, not only checksums differ"
+    if not dry:
+        write(path, fixed)
+    return path, len(data), found, None
+
+
+def repairs(paths: list, processes: int=None, dry: bool=False):
+    """Repair every puzzle in the paths, printing what changes."""
+    start = time.time()
+    scanned = changed = failed = size = 0
+    for path, read, found, error in imap(functools.partial(repair, dry=dry), walk(*paths), processes):
+        scanned += 1
+        size += read
+        if error:
+            failed += 1
+            print("failed %s: %s" % (path, error))
+        elif found:
+            changed += 1
+            print("%s %s: %s" % ("would repair" if dry else "repaired", path, ", ".join(found)))
+    elapsed = max(time.time() - start, 1e-9)
+    print("%i scanned, %i %s, %i failed" % (scanned, changed, "to repair" if dry else "repaired", failed))
+    print("%.1f puzzles/s, %.2f MB/s" % (scanned / elapsed, size / elapsed / 1024**2))
+
+
+# Command line
+def main(arguments: list, directory: str="."):
+    """Run a library command with paths relative to a directory."""
+    parser = argparse.ArgumentParser(prog="library.py", description="Crossword puzzle library tools")
+    parser.add_argument("-p", "--processes", type=int, default=None, help="number of worker processes")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    stats_parser = commands.add_parser("stats", help="corpus statistics")
+    stats_parser.add_argument("paths", nargs="+", help="puzzle files and directories")
+    repair_parser = commands.add_parser("repair", help="recompute and rewrite checksums")
+    repair_parser.add_argument("-n", "--dry-run", action="store_true", help="list changes without writing")
+    repair_parser.add_argument("paths", nargs="+", help="puzzle files and directories")
+    options = parser.parse_args(arguments)
+    paths = [os.path.join(directory, path) for path in options.paths]
+    if options.command == "stats":
+        start = time.time()
+        statistics = stats(paths, options.processes)
+        print(statistics.report())
+        print("processed in %.2f seconds" % (time.time() - start))
+    elif options.command == "repair":
+        repairs(paths, options.processes, options.dry_run)
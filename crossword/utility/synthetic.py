@@ -0,0 +1,31 @@
+"""Synthetic crossword puzzles.
+
+Puzzles are generated from a seed so that benchmarks and tests do not
+depend on the puzzles that happen to be on disk.
+"""
+
+# Import
+import random
+import string
+from crossword import puz
+from crossword.constants import *
+
+
+def synthetic(width: int, height: int, seed: int=0) -> puz.Puzzle:
+    """Generate an unlocked puzzle with a symmetric grid."""
+    generator = random.Random(seed)
+    # Place rotationally symmetric black squares
+    grid = [LETTER] * (width*height)
+    for i in range(len(grid) // 2):
+        if generator.random() < 1/6:
+            grid[i] = grid[len(grid) - 1 - i] = EMPTY
+    numbering = puz.DefaultClueNumbering(grid, range(2 * len(grid)), width, height)
+    # Fill in the rest of the puzzle
+    puzzle = puz.Puzzle()
+    puzzle.width = width
+    puzzle.height = height
+    puzzle.fill = "".join(grid)
+    puzzle.solution = "".join(c if c == EMPTY else generator.choice(string.ascii_uppercase) for c in grid)
+    puzzle.clues = ["Clue %i" % i for i in range(len(numbering.across) + len(numbering.down))]
+    puzzle.title = "%ix%i" % (width, height)
+    return puzzle
@@ -0,0 +1,8 @@
+import os
+import sys
+
+directory = os.getcwd()
+
+import crossword.utility.library
+
+crossword.utility.library.main(sys.argv[1:], directory)
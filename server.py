@@ -1,8 +1,11 @@
 import crossword.network.custom
+from crossword.settings import settings
 
-server = crossword.network.custom.CrosswordServer(("127.0.0.1", 50000))
+if __name__ == "__main__":
+    engine = crossword.network.custom.ENGINES[settings.network.server.engine]
+    server = engine(("127.0.0.1", 50000))
 
-try:
-    server.start()
-except KeyboardInterrupt:
-    server.stop()
+    try:
+        server.start()
+    except KeyboardInterrupt:
+        server.stop()
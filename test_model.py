@@ -0,0 +1,79 @@
+"""Convergence tests for merged puzzle edits.
+
+Run with `python -m pytest test_model.py` or `python -m unittest
+test_model` from the repository root.
+"""
+
+# Import
+import pickle
+import random
+import unittest
+from crossword import puz
+from crossword.application import model
+from crossword.application import layout
+from crossword.utility.synthetic import synthetic
+from crossword.constants import *
+
+# Random schedules checked per test
+SCHEDULES = 2000
+
+
+def schedule(puzzle: puz.Puzzle, generator: random.Random, clients: int=3, edits: int=30) -> bool:
+    """Run one random schedule of concurrent edits and check convergence.
+
+    Clients edit their own board right away and send the edit to the
+    server, which merges it and forwards it to the other clients. The
+    server and the clients handle their queues in a random interleaving.
+    """
+    server = model.PuzzleModel(puzzle, model.ArrayCellsAccess)
+    replicas = [pickle.loads(pickle.dumps(server)) for i in range(clients)]
+    inbox = [[] for i in range(clients)]
+    outbox = [[] for i in range(clients)]
+    letters = [i for i, letter in enumerate(puzzle.solution) if letter != EMPTY]
+    remaining = [edits] * clients
+    while any(remaining) or any(inbox) or any(outbox):
+        client = generator.randrange(clients)
+        step = generator.random()
+        if step < 0.4 and remaining[client]:
+            # Type into one of a few cells so edits collide
+            x, y = model.to_position(generator.choice(letters[:4]), puzzle.width)
+            letter = generator.choice(("", "A", "B"))
+            stamp = replicas[client].edit(x, y, letter, client + 1)
+            outbox[client].append((x, y, letter, client + 1, stamp))
+            remaining[client] -= 1
+        elif step < 0.7 and outbox[client]:
+            # The server handles the next edit of the client
+            edit = outbox[client].pop(0)
+            server.merge(*edit)
+            for other in range(clients):
+                if other != client:
+                    inbox[other].append(edit)
+        elif inbox[client]:
+            replicas[client].merge(*inbox[client].pop(0))
+    fill = server.cells.fill()
+    return all(replica.cells.fill() == fill for replica in replicas)
+
+
+class ConvergenceTest(unittest.TestCase):
+    """Replicas converge through the last-writer-wins registers."""
+
+    def setUp(self):
+        """Keep layouts in memory so tests leave nothing on disk."""
+        self.cache = layout.cache
+        layout.cache = layout.LayoutCache()
+
+    def tearDown(self):
+        """Restore the layout cache."""
+        layout.cache = self.cache
+
+    def test_random_schedules(self):
+        """Every random schedule of concurrent edits converges."""
+        puzzle = synthetic(5, 5)
+        generator = random.Random(0)
+        for i in range(SCHEDULES):
+            with self.subTest(schedule=i):
+                self.assertTrue(schedule(puzzle, generator))
+
+
+if __name__ == "__main__":
+    unittest.main()